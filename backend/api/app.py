@@ -16,39 +16,119 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '../utils'))
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union, Literal, Iterator
 from pathlib import Path
+from functools import lru_cache
+import asyncio
+import base64
+import threading
 import torch
 import numpy as np
-import json
+import orjson
 
 from bdh_instrumented import BDHInstrumented, load_instrumented_bdh
 from state_extractor import StateExtractor
+from inference_batcher import InferenceBatcher, TracedForward
 from bdh import BDHParameters
 
+
+class ORJSONResponse(Response):
+    """
+    JSON response rendered with orjson.
+
+    numpy arrays and scalars are serialized natively from their buffers, so
+    captured states can be returned without first converting every element
+    into a Python object.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps_json(content)
+
+
+def dumps_json(content: Any) -> bytes:
+    """Serialize content with orjson, handling numpy arrays natively"""
+    return orjson.dumps(
+        content,
+        default=_orjson_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+
+def iter_json_document(payload: Dict[str, Any]) -> Iterator[bytes]:
+    """
+    Serialize a response dict as one JSON document, in pieces.
+    
+    Top-level values are encoded one at a time, and per-layer array lists
+    inside "states" one layer at a time, so a StreamingResponse can send the
+    first layers while later ones are still being encoded and only one
+    layer's JSON is held in memory at once.
+    """
+    def members(obj: Dict[str, Any], expand_states: bool) -> Iterator[bytes]:
+        yield b"{"
+        for i, (key, value) in enumerate(obj.items()):
+            yield (b"," if i else b"") + dumps_json(str(key)) + b":"
+            if expand_states and key == "states" and isinstance(value, dict):
+                yield from members(value, expand_states=False)
+            elif isinstance(value, list) and value and isinstance(value[0], np.ndarray):
+                yield b"["
+                for j, item in enumerate(value):
+                    yield (b"," if j else b"") + dumps_json(item)
+                yield b"]"
+            else:
+                yield dumps_json(value)
+        yield b"}"
+    
+    return members(payload, expand_states=True)
+
+
+def _orjson_default(obj):
+    """Fallback for values orjson cannot serialize natively"""
+    # Non-contiguous arrays and unsupported dtypes fall through to here
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().cpu().numpy().tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="BDH Brain Explorer API",
     description="API for visualizing Baby Dragon Hatchling (BDH) architecture",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
-# CORS middleware for frontend
+# CORS middleware for frontend (comma-separated origins, defaults to the Vite dev server)
+ALLOWED_ORIGINS = os.getenv(
+    "CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173"
+).split(",")
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, specify exact origins
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
 )
 
-# Global model cache
-MODEL_CACHE = {
-    'model': None,
-    'config': None,
-    'device': None
-}
+# Serializes forward passes on the shared instrumented model across worker threads
+MODEL_LOCK = threading.Lock()
+
+# torch.compile the untracked forward path at startup (adds warm-up time on first calls);
+# when disabled or unavailable, the forward is traced with torch.jit.trace instead
+TORCH_COMPILE = os.getenv("BDH_TORCH_COMPILE", "1") == "1"
+
+# Return cached CUDA memory to the driver after tracked requests
+ENABLE_CACHE_CLEANING = os.getenv("ENABLE_CACHE_CLEANING") == "1"
+
+# Dynamic batching limits for untracked forward passes
+MAX_BATCH_SIZE = int(os.getenv("BDH_MAX_BATCH_SIZE", "16"))
+MAX_LATENCY_MS = float(os.getenv("BDH_MAX_LATENCY_MS", "5"))
 
 
 # ============================================================================
@@ -59,6 +139,18 @@ class InferenceRequest(BaseModel):
     """Request for BDH inference"""
     input_tokens: List[int] = Field(..., description="List of token IDs")
     track_states: bool = Field(default=True, description="Whether to track internal states")
+    predictions_encoding: Literal["list", "int16_base64"] = Field(
+        default="list",
+        description="Return predictions as a JSON list or as a base64 little-endian int16 buffer"
+    )
+    detail_level: Literal["full", "sparse"] = Field(
+        default="full",
+        description="Return tracked states densely, or as thresholded COO arrays"
+    )
+    state_threshold: float = Field(
+        default=0.1,
+        description="With detail_level=sparse, |value| threshold for attention and Gx/Gy"
+    )
     
     class Config:
         json_schema_extra = {
@@ -89,7 +181,7 @@ class TopologyMetrics(BaseModel):
     max_degree: int
     min_degree: int
     std_degree: float
-    modularity: float
+    modularity: Optional[float]  # None when not computed
     num_communities: int
     hub_threshold: float
     num_hubs: int
@@ -100,21 +192,37 @@ class TopologyMetrics(BaseModel):
 
 class InferenceResponse(BaseModel):
     """Response from BDH inference"""
-    predictions: List[int]
+    predictions: Union[List[int], str]
+    predictions_dtype: Optional[str] = None  # Set when predictions is a base64 buffer
     states: Optional[Dict[str, Any]] = None
     sparsity: Optional[SparsityMetrics] = None
 
 
+class TopologyEdges(BaseModel):
+    """Graph edges in COO form (edge k is row[k] -> col[k] with weight[k])"""
+    row: List[int]
+    col: List[int]
+    weight: List[float]
+
+
 class TopologyResponse(BaseModel):
     """Response with graph topology"""
     nodes: List[Dict[str, Any]]
-    edges: List[Dict[str, Any]]
+    edges: TopologyEdges
     metrics: TopologyMetrics
 
 
 class PathfindingRequest(BaseModel):
     """Request for pathfinding task"""
     board: List[List[int]] = Field(..., description="2D board grid")
+    detail_level: Literal["full", "sparse"] = Field(
+        default="full",
+        description="Return tracked states densely, or as thresholded COO arrays"
+    )
+    state_threshold: float = Field(
+        default=0.1,
+        description="With detail_level=sparse, |value| threshold for attention and Gx/Gy"
+    )
     
     class Config:
         json_schema_extra = {
@@ -143,92 +251,522 @@ def get_device():
         return torch.device("cpu")
 
 
-def load_model():
-    """Load BDH model (trained checkpoint if available, random otherwise)"""
-    if MODEL_CACHE['model'] is None:
-        from pathlib import Path
-        
-        # Check for trained checkpoint
-        checkpoint_path = Path(__file__).parent / '../../checkpoints/bdh_trained.pth'
-        
-        # Create model parameters
-        params = BDHParameters(
-            V=5,
-            T=100,
-            H=4,
-            N=2048,
-            D=64,
-            L=12,
-            dropout=0.1,
-            use_rope=True,
-            use_abs_pos=False
-        )
-        
-        device = get_device()
-        model = BDHInstrumented(params)
-        
-        # Try to load trained checkpoint
-        if checkpoint_path.exists():
-            print("=" * 60)
-            print("🎓 TRAINED MODEL MODE")
-            print("=" * 60)
-            print(f"✓ Loading trained checkpoint from: {checkpoint_path}")
-            try:
-                state_dict = torch.load(checkpoint_path, map_location=device)
-                model.load_state_dict(state_dict)
-                MODEL_CACHE['is_trained'] = True
-                MODEL_CACHE['checkpoint_path'] = str(checkpoint_path)
-                print("✓ Trained model loaded successfully!")
-                print("✓ Expected sparsity: ~5% (learned sparse representations)")
-                print("=" * 60)
-            except Exception as e:
-                print(f"⚠ Error loading checkpoint: {e}")
-                print("⚠ Falling back to random initialization")
-                MODEL_CACHE['is_trained'] = False
-                MODEL_CACHE['checkpoint_path'] = None
-        else:
-            print("=" * 60)
-            print("🎲 DEMO MODE (Random Initialization)")
-            print("=" * 60)
-            print("⚠ No trained checkpoint found")
-            print(f"  Looked in: {checkpoint_path}")
-            print("✓ Using random initialization for demonstration")
-            print("✓ Expected sparsity: ~25% (natural ReLU sparsity)")
-            print("")
-            print("💡 To use trained model:")
-            print("   1. Train on Kaggle (see TRAINING.md)")
-            print("   2. Place checkpoint at: checkpoints/bdh_trained.pth")
-            print("   3. Restart backend")
+def _build_model():
+    """
+    Build the BDH model (trained checkpoint if available, random otherwise).
+    
+    Called once from the startup hook; endpoints read the result from app.state.
+    
+    Returns:
+        (model, device, params, checkpoint_path) where checkpoint_path is None
+        if no trained weights were loaded
+    """
+    # Check for trained checkpoint
+    checkpoint_path = Path(__file__).parent / '../../checkpoints/bdh_trained.pth'
+    
+    # Create model parameters
+    params = BDHParameters(
+        V=5,
+        T=100,
+        H=4,
+        N=2048,
+        D=64,
+        L=12,
+        dropout=0.1,
+        use_rope=True,
+        use_abs_pos=False
+    )
+    
+    # Must be set before the first CUDA allocation to take effect
+    os.environ.setdefault(
+        "PYTORCH_CUDA_ALLOC_CONF",
+        "expandable_segments:True,garbage_collection_threshold:0.8"
+    )
+    
+    device = get_device()
+    model = BDHInstrumented(params)
+    
+    # Try to load trained checkpoint
+    if checkpoint_path.exists():
+        print("=" * 60)
+        print("🎓 TRAINED MODEL MODE")
+        print("=" * 60)
+        print(f"✓ Loading trained checkpoint from: {checkpoint_path}")
+        try:
+            state_dict = torch.load(checkpoint_path, map_location=device)
+            model.load_state_dict(state_dict)
+            loaded_checkpoint = str(checkpoint_path)
+            print("✓ Trained model loaded successfully!")
+            print("✓ Expected sparsity: ~5% (learned sparse representations)")
             print("=" * 60)
-            MODEL_CACHE['is_trained'] = False
-            MODEL_CACHE['checkpoint_path'] = None
-        
-        model.to(device)
-        model.eval()
+        except Exception as e:
+            print(f"⚠ Error loading checkpoint: {e}")
+            print("⚠ Falling back to random initialization")
+            loaded_checkpoint = None
+    else:
+        print("=" * 60)
+        print("🎲 DEMO MODE (Random Initialization)")
+        print("=" * 60)
+        print("⚠ No trained checkpoint found")
+        print(f"  Looked in: {checkpoint_path}")
+        print("✓ Using random initialization for demonstration")
+        print("✓ Expected sparsity: ~25% (natural ReLU sparsity)")
+        print("")
+        print("💡 To use trained model:")
+        print("   1. Train on Kaggle (see TRAINING.md)")
+        print("   2. Place checkpoint at: checkpoints/bdh_trained.pth")
+        print("   3. Restart backend")
+        print("=" * 60)
+        loaded_checkpoint = None
+    
+    model.to(device)
+    model.eval()
+    
+    print(f"✓ Model ready on {device}")
+    
+    return model, device, params, loaded_checkpoint
+
+
+def to_tokens(values) -> torch.Tensor:
+    """
+    Token IDs as a 1-D int64 CPU tensor.
+    
+    Goes through one numpy conversion and wraps its buffer with
+    torch.from_numpy, instead of torch.tensor() boxing every element.
+    """
+    return torch.from_numpy(np.asarray(values, dtype=np.int64).reshape(-1))
+
+
+def find_endpoints(board: np.ndarray) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+    """Locate the start (2) and end (3) cells of a board, or None if missing"""
+    starts = np.argwhere(board == 2)
+    ends = np.argwhere(board == 3)
+    start_pos = (int(starts[0][0]), int(starts[0][1])) if len(starts) else None
+    end_pos = (int(ends[0][0]), int(ends[0][1])) if len(ends) else None
+    return start_pos, end_pos
+
+
+@lru_cache(maxsize=None)
+def _grid_neighbors(rows: int, cols: int) -> Tuple[Tuple[int, ...], ...]:
+    """In-bounds neighbour ids of every flat cell, ordered right, down, left, up"""
+    return tuple(
+        tuple(
+            (r + dr) * cols + (c + dc)
+            for dr, dc in ((0, 1), (1, 0), (0, -1), (-1, 0))
+            if 0 <= r + dr < rows and 0 <= c + dc < cols
+        )
+        for r in range(rows)
+        for c in range(cols)
+    )
+
+
+def bfs_shortest_path(
+    board: np.ndarray,
+    start_pos: Tuple[int, int],
+    end_pos: Tuple[int, int]
+) -> List[List[int]]:
+    """
+    Find the shortest 4-connected path from start to end avoiding walls (1).
+    
+    Returns:
+        Path as a list of [row, col], or [] if end is unreachable
+    """
+    rows, cols = board.shape
+    
+    # Work on a flat grid with integer cell ids (r * cols + c): a preallocated
+    # parent array doubles as the visited set and the queue is a list read
+    # through a head index, so no tuples are hashed or allocated per cell
+    walls = (board.ravel() == 1).tolist()
+    start = start_pos[0] * cols + start_pos[1]
+    end = end_pos[0] * cols + end_pos[1]
+    
+    parent = [-1] * (rows * cols)
+    parent[start] = start
+    queue = [start]
+    head = 0
+    neighbors = _grid_neighbors(rows, cols)
+    
+    while head < len(queue):
+        node = queue[head]
+        head += 1
         
-        MODEL_CACHE['model'] = model
-        MODEL_CACHE['device'] = device
-        MODEL_CACHE['config'] = params
+        if node == end:
+            path = []
+            while node != start:
+                path.append([node // cols, node % cols])
+                node = parent[node]
+            path.append([int(start_pos[0]), int(start_pos[1])])
+            path.reverse()
+            return path
         
-        print(f"✓ Model ready on {device}")
+        for neighbor in neighbors[node]:
+            if parent[neighbor] == -1 and not walls[neighbor]:
+                parent[neighbor] = node
+                queue.append(neighbor)
     
-    return MODEL_CACHE['model'], MODEL_CACHE['device'], MODEL_CACHE['config']
+    return []
 
 
-def convert_numpy_to_python(obj):
-    """Recursively convert numpy types to Python types for JSON serialization"""
-    if isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_to_python(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_to_python(item) for item in obj]
+# ----------------------------------------------------------------------------
+# Blocking request bodies
+#
+# These run in a worker thread via asyncio.to_thread so torch and numpy work
+# never stalls the event loop.
+# ----------------------------------------------------------------------------
+
+@lru_cache(maxsize=1024)
+def _measure_sparsity_cached(tokens: Tuple[int, ...]) -> Dict[str, Any]:
+    """Measure sparsity for a token sequence (memoized until the model is reloaded)"""
+    model = app.state.model
+    input_tokens = to_tokens(tokens).unsqueeze(0).to(app.state.device)
+    with MODEL_LOCK:
+        return model.measure_sparsity(input_tokens)
+
+
+def _render_json(build, *args) -> ORJSONResponse:
+    """Build a payload and serialize it, both in the calling (worker) thread"""
+    return ORJSONResponse(build(*args))
+
+
+def _tracked_infer_payload(logits: torch.Tensor, states: Dict, request: InferenceRequest) -> Dict[str, Any]:
+    """Build the /api/infer payload from a tracked forward pass"""
+    # Sparsity comes from the states just captured, not a second forward pass
+    sparsity_metrics = BDHInstrumented.sparsity_from_states(states)
+    
+    return {
+        **_encode_predictions(logits, request.predictions_encoding),
+        "states": _states_for_response(states, request.detail_level, request.state_threshold),
+        "sparsity": sparsity_metrics
+    }
+
+
+def _states_for_response(states: Dict, detail_level: str, threshold: float) -> Dict:
+    """
+    Tracked states as returned to the client.
+    
+    "full" returns them unchanged. "sparse" converts the large per-layer
+    arrays and Gx/Gy to COO form: activations keep every non-zero entry,
+    attention and topologies only entries above `threshold`.
+    """
+    if detail_level != "sparse":
+        return states
+    
+    sparsify = StateExtractor.sparsify_array
+    sparse_states = dict(states)
+    for key in ('y_activations', 'x_activations'):
+        sparse_states[key] = [sparsify(a) for a in states[key]]
+    sparse_states['attention_weights'] = [sparsify(a, threshold) for a in states['attention_weights']]
+    for key in ('Gx_topology', 'Gy_topology'):
+        if states[key] is not None:
+            sparse_states[key] = sparsify(states[key], threshold)
+    return sparse_states
+
+
+def _extract_visualization(states: Dict) -> Tuple[Dict, Dict]:
+    """Summarize captured states into the sparsity/attention payloads of the pathfinding endpoints"""
+    sparsity = StateExtractor.extract_activation_sparsity(
+        states['y_activations'],
+        states['x_activations']
+    )
+    
+    attention_flow = StateExtractor.extract_attention_flow(
+        states['attention_weights'],
+        top_k=30,
+        attention_topk=states.get('attention_topk')
+    )
+    
+    return (
+        {
+            "y_sparsity_mean": sparsity['y_avg_sparsity'],
+            "y_per_layer": sparsity['y_sparsity_per_layer'],
+            "x_avg": sparsity['x_avg_sparsity'],
+        },
+        {
+            "edges_per_layer": attention_flow['attention_edges_per_layer'],
+            "avg_per_layer": attention_flow['avg_attention_per_layer'],
+        }
+    )
+
+
+def _do_pathfind(
+    board: np.ndarray,
+    logits: torch.Tensor,
+    states: Dict,
+    detail_level: str = "full",
+    state_threshold: float = 0.1
+) -> Dict[str, Any]:
+    """Build the /api/pathfind payload from a tracked forward pass"""
+    predictions = logits.argmax(dim=-1).numpy()
+    
+    # Reshape predictions back to 2D
+    board_size = board.shape[0]
+    predicted_board = predictions.reshape(board_size, board_size)
+    
+    # Find start and end positions
+    start_pos, end_pos = find_endpoints(board)
+    
+    # Simple BFS pathfinding (shares its cache with /api/pathfind-model)
+    solution = []
+    if start_pos and end_pos:
+        solution = _bfs_cached(board_key(board.tolist()), start_pos, end_pos)
+    
+    # Extract visualization data
+    sparsity, attention_flow = _extract_visualization(states)
+    
+    return {
+        "solution": solution,  # Add solution path
+        "input_board": board,
+        "predicted_board": predicted_board,
+        "predictions": predictions,
+        "sparsity": sparsity,
+        "attention_flow": attention_flow,
+        "states": _states_for_response(states, detail_level, state_threshold)
+    }
+
+
+def _encode_predictions(logits: torch.Tensor, encoding: str) -> Dict[str, Any]:
+    """Argmax predictions as a JSON-ready list, or as a compact base64 int16 buffer"""
+    predictions = logits.argmax(dim=-1).numpy()
+    if encoding == "int16_base64":
+        return {
+            "predictions": base64.b64encode(predictions.astype('<i2').tobytes()).decode('ascii'),
+            "predictions_dtype": "int16",
+        }
+    return {"predictions": predictions}
+
+
+def _stream_tracked_inference(
+    logits: torch.Tensor,
+    states: Dict,
+    sparsity_metrics: Dict[str, Any]
+):
+    """
+    Yield a tracked inference result as NDJSON, one line per layer.
+    
+    Lines are {"kind": "layer", ...} for each layer, then one "topology"
+    line with Gx/Gy, then a final "summary" line with predictions and
+    sparsity. Only one layer is serialized at a time.
+    """
+    for i in range(len(states['y_activations'])):
+        yield dumps_json({
+            "kind": "layer",
+            "i": i,
+            "y": states['y_activations'][i],
+            "x": states['x_activations'][i],
+            "attention": states['attention_weights'][i],
+            "output": states['output_frames'][i],
+            "logits": states['logits_frames'][i],
+            "sparsity": states['sparsity_per_layer'][i],
+        }) + b"\n"
+    
+    yield dumps_json({
+        "kind": "topology",
+        "Gx": states['Gx_topology'],
+        "Gy": states['Gy_topology'],
+    }) + b"\n"
+    
+    yield dumps_json({
+        "kind": "summary",
+        "predictions": logits.argmax(dim=-1).numpy(),
+        "sparsity": sparsity_metrics,
+    }) + b"\n"
+
+
+PATHFIND_CHECKPOINT = Path(__file__).parent / '../../checkpoints/bdh_pathfinding_trained.pth'
+
+# Serializes solver construction, so concurrent first requests wait for one
+# load (and compile) instead of each building their own
+SOLVER_LOCK = threading.Lock()
+
+
+def _solver_device() -> str:
+    """Device the pathfinding solver runs on"""
+    return 'cuda' if torch.cuda.is_available() else ('mps' if torch.backends.mps.is_available() else 'cpu')
+
+
+def _get_solver(checkpoint_path: str, checkpoint_mtime: float, device: str):
+    """Load the pathfinding solver once per checkpoint version and device"""
+    with SOLVER_LOCK:
+        return _load_solver(checkpoint_path, checkpoint_mtime, device)
+
+
+@lru_cache(maxsize=None)
+def _load_solver(checkpoint_path: str, checkpoint_mtime: float, device: str):
+    """Build a pathfinding solver (callers hold SOLVER_LOCK)"""
+    sys.path.append(str(Path(__file__).parent / '../models'))
+    from pathfinding_inference import BDHPathfindingSolver
+    
+    return BDHPathfindingSolver(checkpoint_path, device=device, compile_model=TORCH_COMPILE)
+
+
+def _warm_solver():
+    """Load (and compile) the pathfinding solver ahead of the first request"""
+    try:
+        checkpoint_mtime = PATHFIND_CHECKPOINT.stat().st_mtime
+    except OSError:
+        return
+    
+    try:
+        _get_solver(str(PATHFIND_CHECKPOINT.resolve()), checkpoint_mtime, _solver_device())
+        print("✓ Pathfinding solver loaded")
+    except Exception as e:
+        print(f"⚠ Pathfinding solver warm-up failed: {e}")
+
+
+BoardKey = Tuple[Tuple[int, ...], ...]
+
+# Identical boards are common (clients re-submit the same maze to compare
+# modes), so pathfinding solutions are memoized by the board's cells. Tracked
+# states are not: they are several MB per board
+PATHFIND_CACHE_SIZE = 1024
+
+
+def board_key(board: List[List[int]]) -> BoardKey:
+    """Hashable copy of a board's cells, used as the pathfinding cache key"""
+    return tuple(map(tuple, board))
+
+
+@lru_cache(maxsize=PATHFIND_CACHE_SIZE)
+def _bfs_cached(key: BoardKey, start_pos: Tuple[int, int], end_pos: Tuple[int, int]) -> List[List[int]]:
+    """BFS shortest path of a board (memoized by its cells)"""
+    return bfs_shortest_path(np.array(key), start_pos, end_pos)
+
+
+def _solve_with_model(
+    key: BoardKey,
+    start_pos: Tuple[int, int],
+    end_pos: Tuple[int, int]
+) -> Tuple[Optional[List[List[int]]], bool, Optional[str]]:
+    """
+    Solve the board with the trained pathfinding model.
+    
+    Results are memoized per (checkpoint mtime, board), so a retrained
+    checkpoint invalidates them without a server restart.
+    
+    Returns:
+        (model_solution, model_available, model_error)
+    """
+    # Check if pathfinding model checkpoint exists
+    checkpoint_path = PATHFIND_CHECKPOINT
+    
+    try:
+        checkpoint_mtime = checkpoint_path.stat().st_mtime
+    except OSError:
+        return None, False, "Trained model checkpoint not found"
+    
+    # Failures are not memoized: they may be transient (e.g. out of memory)
+    try:
+        return _solve_with_model_cached(
+            str(checkpoint_path.resolve()), checkpoint_mtime, key, start_pos, end_pos
+        )
+    except Exception as e:
+        return None, False, f"Model inference failed: {str(e)}"
+
+
+@lru_cache(maxsize=PATHFIND_CACHE_SIZE)
+def _solve_with_model_cached(
+    checkpoint_path: str,
+    checkpoint_mtime: float,
+    key: BoardKey,
+    start_pos: Tuple[int, int],
+    end_pos: Tuple[int, int]
+) -> Tuple[Optional[List[List[int]]], bool, Optional[str]]:
+    """
+    Model solution of a board for one checkpoint version (see _solve_with_model).
+    
+    Exceptions propagate, so only completed solves are cached.
+    """
+    # Reuse the solver loaded at startup (or by the first request)
+    solver = _get_solver(checkpoint_path, checkpoint_mtime, _solver_device())
+    
+    # Solve
+    path = solver.solve(np.array(key), start_pos, end_pos, max_steps=100)
+    
+    if path:
+        return [[r, c] for r, c in path], True, None
+    return None, False, "Model could not find a solution"
+
+
+# ============================================================================
+# Lifecycle
+# ============================================================================
+
+@app.on_event("startup")
+async def startup():
+    """Load the model once and start the request batching workers in front of it"""
+    model, device, config, checkpoint_path = _build_model()
+    
+    app.state.model = model
+    app.state.device = device
+    app.state.config = config
+    app.state.checkpoint_path = checkpoint_path
+    app.state.is_trained = checkpoint_path is not None
+    
+    # Weights are frozen from here on, so extract the graph topologies once
+    app.state.Gx, app.state.Gy = model.extract_graph_topologies()
+    
+    _compute_topology.cache_clear()
+    _topology_json.cache_clear()
+    _measure_sparsity_cached.cache_clear()
+    _load_solver.cache_clear()
+    _bfs_cached.cache_clear()
+    _solve_with_model_cached.cache_clear()
+    
+    # Plain forward passes have no Python side effects, so they can be compiled
+    # (or, without torch.compile, traced per input shape).
+    # Tracked passes copy states out mid-forward and stay on the eager module.
+    if TORCH_COMPILE and hasattr(torch, "compile"):
+        compiled_model = torch.compile(model, mode="reduce-overhead", dynamic=False, fullgraph=False)
+        print("✓ Untracked forward path compiled with torch.compile")
     else:
-        return obj
+        compiled_model = TracedForward(model)
+        print("✓ Untracked forward path specialized with torch.jit.trace")
+    app.state.compiled_model = compiled_model
+    
+    # Half-precision autocast only pays off (and is only well supported) on CUDA
+    autocast_dtype = torch.float16 if device.type == 'cuda' else None
+    
+    # One CUDA stream per batcher, so input copies of one queue overlap compute of the other
+    app.state.streams = (
+        [torch.cuda.Stream(device=device) for _ in range(2)] if device.type == 'cuda' else [None, None]
+    )
+    
+    # Untracked requests are fused into padded batches
+    app.state.batcher = InferenceBatcher(
+        compiled_model, device,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_latency_ms=MAX_LATENCY_MS,
+        lock=MODEL_LOCK,
+        autocast_dtype=autocast_dtype,
+        max_seq_len=config.T,
+        stream=app.state.streams[0],
+        # Bucket shapes so compiled graphs (and CUDA graphs) are reused
+        static_shapes=compiled_model is not model
+    )
+    # Tracked requests get their own queue so they never force frame capture on the others
+    app.state.tracked_batcher = InferenceBatcher(
+        model, device,
+        capture_frames=True,
+        lock=MODEL_LOCK,
+        autocast_dtype=autocast_dtype,
+        release_cache=ENABLE_CACHE_CLEANING,
+        max_seq_len=config.T,
+        stream=app.state.streams[1]
+    )
+    
+    app.state.batcher.start()
+    app.state.tracked_batcher.start()
+    
+    # Build and compile the pathfinding solver in the background, so neither
+    # startup nor the first /api/pathfind-model request pays for it
+    app.state.solver_warmup = asyncio.create_task(asyncio.to_thread(_warm_solver))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop the request batching workers"""
+    await app.state.batcher.stop()
+    await app.state.tracked_batcher.stop()
 
 
 # ============================================================================
@@ -244,6 +782,7 @@ async def root():
         "status": "running",
         "endpoints": {
             "inference": "/api/infer",
+            "inference_stream": "/api/infer-stream",
             "topology": "/api/topology",
             "sparsity": "/api/sparsity",
             "pathfind": "/api/pathfind",
@@ -256,14 +795,12 @@ async def root():
 @app.get("/api/model-status")
 async def get_model_status():
     """Get model training status"""
-    load_model()  # Ensure model is checked
-    
-    is_trained = MODEL_CACHE.get('is_trained', False)
-    checkpoint_path = MODEL_CACHE.get('checkpoint_path')
+    is_trained = app.state.is_trained
+    checkpoint_path = app.state.checkpoint_path
     
     return {
         "is_trained": is_trained,
-        "device": str(MODEL_CACHE.get('device', 'cpu')),
+        "device": str(app.state.device),
         "checkpoint_available": checkpoint_path is not None,
         "checkpoint_path": checkpoint_path,
         "expected_sparsity": "5%" if is_trained else "~25%",
@@ -275,11 +812,11 @@ async def get_model_status():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    model, device, config = load_model()
+    config = app.state.config
     return {
         "status": "healthy",
-        "model_loaded": model is not None,
-        "device": str(device),
+        "model_loaded": app.state.model is not None,
+        "device": str(app.state.device),
         "config": {
             "neurons": config.N,
             "layers": config.L,
@@ -288,7 +825,7 @@ async def health_check():
     }
 
 
-@app.post("/api/infer")
+@app.post("/api/infer", response_model=InferenceResponse)
 async def infer(request: InferenceRequest):
     """
     Run BDH inference on input tokens
@@ -296,50 +833,98 @@ async def infer(request: InferenceRequest):
     Returns predictions and optionally internal states
     """
     try:
-        model, device, _ = load_model()
-        
         # Convert input to tensor
-        input_tokens = torch.tensor([request.input_tokens], dtype=torch.long).to(device)
+        tokens = to_tokens(request.input_tokens)
         
         # Run inference
-        with torch.no_grad():
-            if request.track_states:
-                model.enable_tracking()
-                logits, output_frames, x_frames, y_frames, attn_frames, logits_frames = \
-                    model(input_tokens, capture_frames=True)
-                
-                states = model.get_states()
-                
-                # Convert states to JSON-serializable format
-                states_json = convert_numpy_to_python(states)
-                
-                # Measure sparsity
-                sparsity_metrics = model.measure_sparsity(input_tokens)
-                
-                response = InferenceResponse(
-                    predictions=logits.argmax(dim=-1).squeeze(0).cpu().tolist(),
-                    states=states_json,
-                    sparsity=SparsityMetrics(**sparsity_metrics)
-                )
-            else:
-                logits = model(input_tokens, capture_frames=False)
-                response = InferenceResponse(
-                    predictions=logits.argmax(dim=-1).squeeze(0).cpu().tolist()
-                )
+        if request.track_states:
+            # States hold raw numpy arrays; ORJSONResponse serializes them directly
+            logits, states = await app.state.tracked_batcher.submit(tokens)
+            
+            # The payload holds every layer's states, so build and serialize it off the event loop
+            return await asyncio.to_thread(
+                _render_json, _tracked_infer_payload, logits, states, request
+            )
+        
+        # Coalesced with concurrent requests into one forward pass
+        logits = await app.state.batcher.submit(tokens)
+        return ORJSONResponse({
+            **_encode_predictions(logits, request.predictions_encoding),
+            "states": None,
+            "sparsity": None
+        })
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/infer-stream")
+async def infer_stream(request: InferenceRequest):
+    """
+    Run BDH inference with state tracking and stream the result as NDJSON
+    
+    Same data as /api/infer with track_states=True, but written one layer
+    per line instead of as a single JSON document
+    """
+    try:
+        tokens = to_tokens(request.input_tokens)
         
-        return response
+        logits, states = await app.state.tracked_batcher.submit(tokens)
+        sparsity_metrics = await asyncio.to_thread(BDHInstrumented.sparsity_from_states, states)
+        
+        # A sync generator is iterated in Starlette's threadpool, off the event loop
+        return StreamingResponse(
+            _stream_tracked_inference(logits, states, sparsity_metrics),
+            media_type="application/x-ndjson"
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Topology cache
-TOPOLOGY_CACHE = {}
+@lru_cache(maxsize=32)
+def _compute_topology(
+    threshold: float,
+    top_k_nodes: Optional[int],
+    compute_modularity: bool = True
+) -> TopologyResponse:
+    """Analyze the cached Gx topology (memoized until the model is reloaded)"""
+    print(f"Computing topology for threshold={threshold}, top_k={top_k_nodes}, "
+          f"modularity={compute_modularity}...")
+    
+    # Use StateExtractor for detailed analysis
+    topology = StateExtractor.extract_graph_topology(
+        app.state.Gx,
+        threshold=threshold,
+        top_k_nodes=top_k_nodes,
+        compute_modularity=compute_modularity
+    )
+    
+    print(f"✓ Topology computed and cached ({len(topology['nodes'])} nodes, {len(topology['edges']['row'])} edges)")
+    
+    # Convert to response format (model_construct: our own output, no need to re-validate)
+    return TopologyResponse.model_construct(
+        nodes=topology['nodes'],
+        edges=TopologyEdges.model_construct(**topology['edges']),
+        metrics=TopologyMetrics.model_construct(**topology['metrics'])
+    )
+
+
+@lru_cache(maxsize=32)
+def _topology_json(
+    threshold: float,
+    top_k_nodes: Optional[int],
+    compute_modularity: bool = True
+) -> bytes:
+    """Serialized /api/topology body, so repeat requests skip model_dump and encoding"""
+    return dumps_json(_compute_topology(threshold, top_k_nodes, compute_modularity).model_dump())
 
-@app.get("/api/topology")
+
+@app.get("/api/topology", response_model=TopologyResponse)
 async def get_topology(
     threshold: float = 0.01,  # Lowered from 0.1 to work with trained model
-    top_k_nodes: Optional[int] = None
+    top_k_nodes: Optional[int] = None,
+    compute_modularity: bool = True
 ):
     """
     Get BDH graph topology (Gx matrix)
@@ -347,50 +932,23 @@ async def get_topology(
     Args:
         threshold: Edge weight threshold for filtering
         top_k_nodes: If set, return only top-k nodes by degree
+        compute_modularity: Run community detection (the slowest part);
+            if false, metrics.modularity is null
     
     Returns:
         Graph topology with nodes, edges, and metrics
     """
     try:
-        # Check cache
-        cache_key = f"{threshold}_{top_k_nodes}"
-        if cache_key in TOPOLOGY_CACHE:
-            print(f"✓ Using cached topology for threshold={threshold}, top_k={top_k_nodes}")
-            return TOPOLOGY_CACHE[cache_key]
-        
-        print(f"Computing topology for threshold={threshold}, top_k={top_k_nodes}...")
-        
-        model, device, _ = load_model()
-        
-        # Extract Gx topology
-        Gx, Gy = model.extract_graph_topologies()
-        
-        # Use StateExtractor for detailed analysis
-        topology = StateExtractor.extract_graph_topology(
-            Gx,
-            threshold=threshold,
-            top_k_nodes=top_k_nodes
-        )
-        
-        # Convert to response format
-        response = TopologyResponse(
-            nodes=topology['nodes'],
-            edges=topology['edges'],
-            metrics=TopologyMetrics(**topology['metrics'])
-        )
+        body = await asyncio.to_thread(_topology_json, threshold, top_k_nodes, compute_modularity)
         
-        # Cache the result
-        TOPOLOGY_CACHE[cache_key] = response
-        print(f"✓ Topology computed and cached ({len(topology['nodes'])} nodes, {len(topology['edges'])} edges)")
-        
-        return response
+        return Response(content=body, media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
-@app.post("/api/sparsity")
+@app.post("/api/sparsity", response_model=SparsityMetrics)
 async def measure_sparsity(request: InferenceRequest):
     """
     Measure activation sparsity on given input
@@ -398,225 +956,103 @@ async def measure_sparsity(request: InferenceRequest):
     Returns detailed sparsity metrics
     """
     try:
-        model, device, _ = load_model()
-        
-        # Convert input to tensor
-        input_tokens = torch.tensor([request.input_tokens], dtype=torch.long).to(device)
-        
-        # Measure sparsity
-        sparsity_metrics = model.measure_sparsity(input_tokens)
+        # Measure sparsity (repeat sequences are served from cache)
+        sparsity_metrics = await asyncio.to_thread(
+            _measure_sparsity_cached, tuple(request.input_tokens)
+        )
         
-        return SparsityMetrics(**sparsity_metrics)
+        # Already has exactly the SparsityMetrics fields; no model round trip needed
+        return ORJSONResponse(sparsity_metrics)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/pathfind")
-async def pathfind(request: PathfindingRequest):
+async def pathfind(request: PathfindingRequest, meta: bool = False):
     """
     Solve pathfinding task with BDH
     
-    Takes a 2D board and returns the solution with visualization data
+    Takes a 2D board and returns the solution with visualization data.
+    With ?meta=1 only the BFS step count is returned, without running the
+    model.
     """
     try:
-        model, device, _ = load_model()
+        # Board cells, hashable as the cache key
+        key = board_key(request.board)
+        board = np.array(key)
         
-        # Flatten board to token sequence
-        board = np.array(request.board)
-        board_flat = board.flatten()
-        input_tokens = torch.tensor([board_flat], dtype=torch.long).to(device)
+        if meta:
+            start_pos, end_pos = find_endpoints(board)
+            solution = []
+            if start_pos and end_pos:
+                solution = await asyncio.to_thread(_bfs_cached, key, start_pos, end_pos)
+            return {"steps": len(solution)}
         
         # Run inference with state tracking
-        model.enable_tracking()
-        with torch.no_grad():
-            logits, output_frames, x_frames, y_frames, attn_frames, logits_frames = \
-                model(input_tokens, capture_frames=True)
-        
-        states = model.get_states()
-        predictions = logits.argmax(dim=-1).squeeze(0).cpu().numpy()
-        
-        # Reshape predictions back to 2D
-        board_size = board.shape[0]
-        predicted_board = predictions.reshape(board_size, board_size)
+        logits, states = await app.state.tracked_batcher.submit(to_tokens(key))
         
-        # Find start and end positions
-        start_pos = None
-        end_pos = None
-        for i in range(board_size):
-            for j in range(board_size):
-                if board[i][j] == 2:
-                    start_pos = (i, j)
-                elif board[i][j] == 3:
-                    end_pos = (i, j)
-        
-        # Simple BFS pathfinding
-        solution = []
-        if start_pos and end_pos:
-            from collections import deque
-            
-            queue = deque([(start_pos, [start_pos])])
-            visited = {start_pos}
-            
-            while queue:
-                (row, col), path = queue.popleft()
-                
-                if (row, col) == end_pos:
-                    solution = [[r, c] for r, c in path]
-                    break
-                
-                # Check 4 directions
-                for dr, dc in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
-                    new_row, new_col = row + dr, col + dc
-                    
-                    if (0 <= new_row < board_size and 
-                        0 <= new_col < board_size and
-                        (new_row, new_col) not in visited and
-                        board[new_row][new_col] != 1):  # Not a wall
-                        
-                        visited.add((new_row, new_col))
-                        queue.append(((new_row, new_col), path + [(new_row, new_col)]))
-        
-        # Extract visualization data
-        sparsity = StateExtractor.extract_activation_sparsity(
-            states['y_activations'],
-            states['x_activations']
+        payload = await asyncio.to_thread(
+            _do_pathfind, board, logits, states, request.detail_level, request.state_threshold
         )
         
-        attention_flow = StateExtractor.extract_attention_flow(
-            states['attention_weights'],
-            top_k=30
-        )
-        
-        return {
-            "solution": solution,  # Add solution path
-            "input_board": board.tolist(),
-            "predicted_board": predicted_board.tolist(),
-            "predictions": predictions.tolist(),
-            "sparsity": {
-                "y_sparsity_mean": sparsity['y_avg_sparsity'],
-                "y_per_layer": sparsity['y_sparsity_per_layer'],
-                "x_avg": sparsity['x_avg_sparsity'],
-            },
-            "attention_flow": {
-                "edges_per_layer": attention_flow['attention_edges_per_layer'],
-                "avg_per_layer": attention_flow['avg_attention_per_layer'],
-            },
-            "states": convert_numpy_to_python(states)
-        }
+        # A sync iterator is consumed in Starlette's threadpool, off the event loop
+        return StreamingResponse(iter_json_document(payload), media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/pathfind-model")
-async def pathfind_with_model(request: PathfindingRequest):
+async def pathfind_with_model(request: PathfindingRequest, meta: bool = False):
     """
     Solve pathfinding using trained BDH model
     
     Uses the trained pathfinding model if available, otherwise falls back to BFS.
-    Returns both model solution and BFS solution for comparison.
+    Returns both model solution and BFS solution for comparison. With ?meta=1
+    only the model status, step counts and match flag are returned, and the
+    tracked visualization pass is skipped.
     """
     try:
         # Get board and positions
-        board = np.array(request.board)
-        board_size = board.shape[0]
+        key = board_key(request.board)
+        board = np.array(key)
         
         # Find start and end positions
-        start_pos = None
-        end_pos = None
-        for i in range(board_size):
-            for j in range(board_size):
-                if board[i][j] == 2:
-                    start_pos = (i, j)
-                elif board[i][j] == 3:
-                    end_pos = (i, j)
+        start_pos, end_pos = find_endpoints(board)
         
         if not start_pos or not end_pos:
             raise HTTPException(status_code=400, detail="Board must have start (2) and end (3) positions")
         
-        # BFS solution (always compute as fallback/comparison)
-        from collections import deque
-        
-        queue = deque([(start_pos, [start_pos])])
-        visited = {start_pos}
-        bfs_solution = []
-        
-        while queue:
-            (row, col), path = queue.popleft()
-            
-            if (row, col) == end_pos:
-                bfs_solution = [[r, c] for r, c in path]
-                break
-            
-            for dr, dc in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
-                new_row, new_col = row + dr, col + dc
-                
-                if (0 <= new_row < board_size and 
-                    0 <= new_col < board_size and
-                    (new_row, new_col) not in visited and
-                    board[new_row][new_col] != 1):
-                    
-                    visited.add((new_row, new_col))
-                    queue.append(((new_row, new_col), path + [(new_row, new_col)]))
-        
-        # Try model-based solution
-        model_solution = None
-        model_available = False
-        model_error = None
-        
-        try:
-            # Check if pathfinding model checkpoint exists
-            checkpoint_path = Path(__file__).parent / '../../checkpoints/bdh_pathfinding_trained.pth'
-            
-            if checkpoint_path.exists():
-                # Import solver
-                import sys
-                sys.path.append(str(Path(__file__).parent / '../models'))
-                from pathfinding_inference import BDHPathfindingSolver
-                
-                # Create solver
-                device = 'cuda' if torch.cuda.is_available() else ('mps' if torch.backends.mps.is_available() else 'cpu')
-                solver = BDHPathfindingSolver(str(checkpoint_path), device=device)
-                
-                # Solve
-                path = solver.solve(board, start_pos, end_pos, max_steps=100)
-                
-                if path:
-                    model_solution = [[r, c] for r, c in path]
-                    model_available = True
-                else:
-                    model_error = "Model could not find a solution"
-            else:
-                model_error = "Trained model checkpoint not found"
-                
-        except Exception as e:
-            model_error = f"Model inference failed: {str(e)}"
-        
-        # Get model and run visualization
-        model, device, _ = load_model()
-        board_flat = board.flatten()
-        input_tokens = torch.tensor([board_flat], dtype=torch.long).to(device)
-        
-        model.enable_tracking()
-        with torch.no_grad():
-            logits, output_frames, x_frames, y_frames, attn_frames, logits_frames = \
-                model(input_tokens, capture_frames=True)
-        
-        states = model.get_states()
+        if meta:
+            bfs_solution, (model_solution, model_available, model_error) = await asyncio.gather(
+                asyncio.to_thread(_bfs_cached, key, start_pos, end_pos),
+                asyncio.to_thread(_solve_with_model, key, start_pos, end_pos)
+            )
+            return {
+                "model_available": model_available,
+                "model_error": model_error,
+                "solutions_match": model_solution == bfs_solution if model_solution else False,
+                "model_steps": len(model_solution) if model_solution else None,
+                "bfs_steps": len(bfs_solution),
+            }
         
-        # Extract visualization data
-        sparsity = StateExtractor.extract_activation_sparsity(
-            states['y_activations'],
-            states['x_activations']
+        # The BFS solution (always computed as fallback/comparison), the
+        # model-based solution and the tracked visualization pass are
+        # independent, so run them concurrently (the solutions are memoized per board)
+        bfs_solution, (model_solution, model_available, model_error), (logits, states) = await asyncio.gather(
+            asyncio.to_thread(_bfs_cached, key, start_pos, end_pos),
+            asyncio.to_thread(_solve_with_model, key, start_pos, end_pos),
+            app.state.tracked_batcher.submit(to_tokens(key))
         )
         
-        attention_flow = StateExtractor.extract_attention_flow(
-            states['attention_weights'],
-            top_k=30
+        # Extract visualization data
+        sparsity, attention_flow = await asyncio.to_thread(_extract_visualization, states)
+        states = await asyncio.to_thread(
+            _states_for_response, states, request.detail_level, request.state_threshold
         )
         
-        return {
+        return StreamingResponse(iter_json_document({
             "model_available": model_available,
             "model_solution": model_solution,
             "model_error": model_error,
@@ -624,18 +1060,11 @@ async def pathfind_with_model(request: PathfindingRequest):
             "solutions_match": model_solution == bfs_solution if model_solution else False,
             "model_steps": len(model_solution) if model_solution else None,
             "bfs_steps": len(bfs_solution),
-            "input_board": board.tolist(),
-            "sparsity": {
-                "y_sparsity_mean": sparsity['y_avg_sparsity'],
-                "y_per_layer": sparsity['y_sparsity_per_layer'],
-                "x_avg": sparsity['x_avg_sparsity'],
-            },
-            "attention_flow": {
-                "edges_per_layer": attention_flow['attention_edges_per_layer'],
-                "avg_per_layer": attention_flow['avg_attention_per_layer'],
-            },
-            "states": convert_numpy_to_python(states)
-        }
+            "input_board": board,
+            "sparsity": sparsity,
+            "attention_flow": attention_flow,
+            "states": states
+        }), media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -645,7 +1074,7 @@ async def pathfind_with_model(request: PathfindingRequest):
 async def get_config():
     """Get model configuration"""
     try:
-        _, _, config = load_model()
+        config = app.state.config
         
         return {
             "vocabulary_size": config.V,
@@ -674,13 +1103,25 @@ if __name__ == "__main__":
     print("🚀 Starting BDH Brain Explorer API")
     print("="*60)
     
-    # Pre-load model
-    print("\n📦 Loading model...")
-    load_model()
-    
-    print("\n✓ Model loaded successfully!")
+    # The model is loaded by the startup hook before the first request is served
     print("\n📡 Starting server on http://localhost:8000")
     print("📚 API docs available at http://localhost:8000/docs")
     print("\n" + "="*60 + "\n")
     
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker is a separate process that loads its own model (and CUDA
+    # context) in the startup hook. When serving from a single GPU keep
+    # WEB_CONCURRENCY=1 and let the batchers multiplex requests instead.
+    # BDH_LIMIT_CONCURRENCY caps in-flight requests per worker; beyond it
+    # clients get a 503 instead of queueing without bound.
+    # "auto" picks uvloop/httptools when installed (not available on Windows)
+    # and falls back to asyncio/h11 otherwise.
+    limit_concurrency = os.getenv("BDH_LIMIT_CONCURRENCY")
+    uvicorn.run(
+        "app:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        limit_concurrency=int(limit_concurrency) if limit_concurrency else None
+    )
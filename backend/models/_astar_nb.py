@@ -0,0 +1,155 @@
+"""
+A* Search for the Pathfinding Solver
+
+Grid A* with a Manhattan heuristic over flat cell ids, written on plain
+numpy arrays so it compiles with Numba. Numba is optional: without it the
+same functions run as ordinary Python.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that returns the function unchanged"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+@njit(cache=True)
+def _heap_push(heap_key, heap_node, length, key, node):
+    """Insert (key, node) into the binary min-heap; returns the new length"""
+    i = length
+    while i > 0:
+        p = (i - 1) >> 1
+        if heap_key[p] <= key:
+            break
+        heap_key[i] = heap_key[p]
+        heap_node[i] = heap_node[p]
+        i = p
+    heap_key[i] = key
+    heap_node[i] = node
+    return length + 1
+
+
+@njit(cache=True)
+def _heap_pop(heap_key, heap_node, length):
+    """Remove the smallest entry; returns (node, new length)"""
+    node = heap_node[0]
+    length -= 1
+    key = heap_key[length]
+    last = heap_node[length]
+
+    i = 0
+    while True:
+        c = 2 * i + 1
+        if c >= length:
+            break
+        if c + 1 < length and heap_key[c + 1] < heap_key[c]:
+            c += 1
+        if heap_key[c] >= key:
+            break
+        heap_key[i] = heap_key[c]
+        heap_node[i] = heap_node[c]
+        i = c
+    heap_key[i] = key
+    heap_node[i] = last
+    return node, length
+
+
+@njit(cache=True)
+def _bit_test(bits, i):
+    """Whether bit i of the uint64 word bitmap is set"""
+    return ((bits[i >> 6] >> np.uint64(i & 63)) & np.uint64(1)) != 0
+
+
+@njit(cache=True)
+def _bit_set(bits, i):
+    """Set bit i of the uint64 word bitmap"""
+    bits[i >> 6] |= np.uint64(1) << np.uint64(i & 63)
+
+
+@njit(cache=True)
+def astar(board_flat, size, start, end, tie_rank):
+    """
+    Shortest path between two cells of a size x size grid.
+
+    Args:
+        board_flat: Flattened board (int8, C-contiguous), 1 = wall
+        size: Side length of the board
+        start: Flat id of the start cell
+        end: Flat id of the end cell
+        tie_rank: Per-cell rank (int32, lower = preferred) that orders
+            frontier cells with equal f
+
+    Returns:
+        int32 array of flat cell ids from start to end, empty if unreachable
+    """
+    n = size * size
+    end_row = end // size
+    end_col = end % size
+
+    g = np.full(n, -1, np.int32)
+    parent = np.full(n, -1, np.int32)
+    # Closed set as a bitmap: two uint64 words cover a 10 x 10 board
+    closed = np.zeros((n + 63) >> 6, np.uint64)
+
+    # Heap keyed on f * n + tie_rank. A cell is pushed at most once per
+    # neighbour that improves its g, so 4 * n + 1 entries always suffice.
+    heap_key = np.empty(4 * n + 1, np.int32)
+    heap_node = np.empty(4 * n + 1, np.int32)
+
+    g[start] = 0
+    h = abs(start // size - end_row) + abs(start % size - end_col)
+    heap_len = _heap_push(heap_key, heap_node, 0, h * n + tie_rank[start], start)
+
+    while heap_len > 0:
+        node, heap_len = _heap_pop(heap_key, heap_node, heap_len)
+        if _bit_test(closed, node):
+            continue
+        _bit_set(closed, node)
+        if node == end:
+            break
+
+        row = node // size
+        col = node % size
+        cost = g[node] + 1
+        for k in range(4):
+            if k == 0:
+                if row == 0:
+                    continue
+                nb = node - size
+            elif k == 1:
+                if row == size - 1:
+                    continue
+                nb = node + size
+            elif k == 2:
+                if col == 0:
+                    continue
+                nb = node - 1
+            else:
+                if col == size - 1:
+                    continue
+                nb = node + 1
+
+            if board_flat[nb] == 1 or _bit_test(closed, nb):
+                continue
+            if g[nb] != -1 and g[nb] <= cost:
+                continue
+
+            g[nb] = cost
+            parent[nb] = node
+            h = abs(nb // size - end_row) + abs(nb % size - end_col)
+            heap_len = _heap_push(heap_key, heap_node, heap_len, (cost + h) * n + tie_rank[nb], nb)
+
+    if not _bit_test(closed, end):
+        return np.empty(0, np.int32)
+
+    path = np.empty(g[end] + 1, np.int32)
+    node = end
+    for i in range(g[end], -1, -1):
+        path[i] = node
+        node = parent[node]
+    return path
@@ -18,6 +18,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '../../reference-bdh'))
 import torch
 import torch.nn as nn
 import numpy as np
+from functools import partial
 from typing import Dict, List, Tuple, Optional
 from bdh import BDH, BDHParameters
 
@@ -38,8 +39,24 @@ class BDHInstrumented(BDH):
         
         # State tracking
         self.tracking_enabled = False
+        self._capture_topology = True
+        self._capture_attention = True
+        self._activation_dtype: Optional[torch.dtype] = None
         self.states = self._init_states()
         
+        # Reusable device buffers for captured frames, one [L, ...] tensor per category
+        self._frame_pool: Dict[str, torch.Tensor] = {}
+        
+        # (Gx, Gy) from the last extraction, valid while the weights keep the same version
+        self._topo_cache: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._topo_version: Optional[Tuple] = None
+        
+        # Strongest attention edges per layer to summarize on device during tracking
+        self.attention_top_k = 30
+        
+        # torch.compile'd frame-capturing forward (see compile_capture), or None for eager
+        self._compiled_capture = None
+        
     def _init_states(self) -> Dict:
         """Initialize state tracking dictionary"""
         return {
@@ -49,33 +66,97 @@ class BDHInstrumented(BDH):
             'output_frames': [],       # Predictions per layer [L, T]
             'logits_frames': [],       # Logits per layer [L, T, V]
             'sparsity_per_layer': [],  # Sparsity measurements [L]
+            'x_sparsity_per_layer': [],  # Context activation sparsity [L]
+            'attention_topk': None,    # Top-k attention edges per layer (see _attention_topk)
             'Gx_topology': None,       # Causal circuit graph [N, N]
             'Gy_topology': None,       # Output circuit graph [N, N]
             'layer_norms': [],         # Layer normalization stats
         }
     
-    def enable_tracking(self):
-        """Enable state tracking for next forward pass"""
+    def enable_tracking(
+        self,
+        capture_topology: bool = True,
+        capture_attention: bool = True,
+        activation_dtype: Optional[torch.dtype] = None
+    ):
+        """
+        Enable state tracking for next forward pass
+        
+        Args:
+            capture_topology: Also store Gx/Gy in the states; callers that
+                only need activations (e.g. measure_sparsity) can skip them
+            capture_attention: Copy the full [L, B, T, T] attention matrices
+                to the host. When False, 'attention_weights' stays empty and
+                only the on-device top-k summary ('attention_topk') is kept
+            activation_dtype: Store the captured x/y activations in this dtype
+                (e.g. torch.float16) to halve their device-to-host copy and
+                every downstream scan; None keeps the model's dtype. It must
+                have a NumPy equivalent (so not bfloat16), and values below
+                its smallest subnormal round to zero
+        """
         self.tracking_enabled = True
+        self._capture_topology = capture_topology
+        self._capture_attention = capture_attention
+        self._activation_dtype = activation_dtype
         self.states = self._init_states()
     
     def disable_tracking(self):
         """Disable state tracking"""
         self.tracking_enabled = False
     
+    def compile_capture(self, mode: str = "reduce-overhead"):
+        """
+        Compile the frame-capturing forward pass with torch.compile.
+        
+        Only the base model's pass is compiled, specialized to the input shape
+        (dynamic=False); copying frames into the pooled buffers and tracked
+        states has Python side effects and stays eager. The first call per
+        shape compiles, so warm up before timing. With "reduce-overhead"
+        (CUDA graphs) the returned frames are only valid until the next pass.
+        """
+        self._compiled_capture = torch.compile(
+            partial(BDH.forward, self, capture_frames=True),
+            mode=mode,
+            dynamic=False,
+            fullgraph=False
+        )
+    
+    def _forward_frames(self, input_):
+        """Base forward pass with capture_frames=True, compiled if enabled"""
+        if self._compiled_capture is not None:
+            return self._compiled_capture(input_)
+        return super().forward(input_, capture_frames=True)
+    
     def get_states(self) -> Dict:
         """Return captured states"""
         return self.states
     
+    def _weights_version(self) -> Tuple:
+        """
+        Identify the current E, Dx and Dy weights.
+        
+        In-place updates (optimizer steps, load_state_dict) bump a tensor's
+        version counter, and replacing a parameter changes its storage, so the
+        key changes whenever the topology could.
+        """
+        return tuple((p.data_ptr(), p._version) for p in (self.E, self.Dx, self.Dy))
+    
     def extract_graph_topologies(self) -> Tuple[np.ndarray, np.ndarray]:
         """
         Extract Gx and Gy graph topologies.
         
+        The result is cached until the weights change; the returned arrays are
+        shared between callers and therefore read-only.
+        
         Returns:
             Gx: Causal circuit [N, N]
             Gy: Output circuit [N, N]
         """
-        with torch.no_grad():
+        version = self._weights_version()
+        if self._topo_cache is not None and self._topo_version == version:
+            return self._topo_cache
+        
+        with torch.inference_mode():
             # E: [N, D]
             # Dx: [H, D, N//H]
             # Dy: [H, D, N//H]
@@ -83,27 +164,22 @@ class BDHInstrumented(BDH):
             H, D, Nh = self.Dx.shape
             N = self.N
             
-            # Compute Gx = E @ Dx for each head, then combine
-            Gx_heads = []
-            Gy_heads = []
-            
-            for h in range(H):
-                # Gx_h = E @ Dx[h]  # [N, D] @ [D, N//H] -> [N, N//H]
-                Gx_h = self.E @ self.Dx[h]
-                Gx_heads.append(Gx_h)
-                
-                # Gy_h = Dy[h].T @ E.T  # [D, N//H].T @ [N, D].T -> [N//H, D] @ [D, N] -> [N//H, N]
-                Gy_h = self.Dy[h].T @ self.E.T
-                Gy_heads.append(Gy_h)
-            
-            # Concatenate heads: [N, H * N//H] = [N, N]
-            Gx = torch.cat(Gx_heads, dim=1).cpu().numpy()
+            # Gx = E @ [Dx[0] | Dx[1] | ...]: lay the heads side by side
+            # [H, D, N//H] -> [D, H * N//H], so one matmul gives [N, N]
+            Dx_flat = self.Dx.permute(1, 0, 2).reshape(D, H * Nh)
+            Gx = (self.E @ Dx_flat).cpu().numpy()
             
-            # For Gy, we need to transpose and concatenate differently
-            # Each Gy_h is [N//H, N], stack them to get [H * N//H, N] = [N, N]
-            Gy = torch.cat(Gy_heads, dim=0).cpu().numpy()
-            
-            return Gx, Gy
+            # Gy stacks Dy[h].T @ E.T over heads: [H, D, N//H] -> [H * N//H, D],
+            # so one matmul gives [N, N]
+            Dy_flat = self.Dy.permute(0, 2, 1).reshape(H * Nh, D)
+            Gy = (Dy_flat @ self.E.T).cpu().numpy()
+        
+        Gx.setflags(write=False)
+        Gy.setflags(write=False)
+        self._topo_cache = (Gx, Gy)
+        self._topo_version = version
+        
+        return Gx, Gy
     
     def forward(self, input_, capture_frames=False):
         """
@@ -123,7 +199,7 @@ class BDHInstrumented(BDH):
         
         # Call parent forward pass
         if capture_frames:
-            result = super().forward(input_, capture_frames=True)
+            result = self._forward_frames(input_)
             logits, output_frames, x_frames, y_frames, attn_frames, logits_frames = result
             
             # If tracking enabled, store states
@@ -134,24 +210,117 @@ class BDHInstrumented(BDH):
         else:
             return super().forward(input_, capture_frames=False)
     
+    def _pool_frames(
+        self,
+        name: str,
+        frames: List[torch.Tensor],
+        dtype: Optional[torch.dtype] = None
+    ) -> np.ndarray:
+        """
+        Copy per-layer frames into a pooled [L, ...] device buffer and bring
+        it to the host in one transfer.
+        
+        The returned host array is a fresh copy, so it stays valid after the
+        next forward pass. On CPU, .cpu() returns the pooled buffer itself, so
+        the copy is made explicitly there.
+        """
+        buf = self._fill_pool(name, frames, dtype)
+        if buf.device.type == 'cpu':
+            return buf.numpy().copy()
+        return buf.cpu().numpy()
+    
+    def _fill_pool(
+        self,
+        name: str,
+        frames: List[torch.Tensor],
+        dtype: Optional[torch.dtype] = None
+    ) -> torch.Tensor:
+        """
+        Copy per-layer frames into the pooled [L, ...] device buffer `name`,
+        converting them to `dtype` if given.
+        
+        The buffer is reused across forward passes and only reallocated when
+        the frame shape, dtype or device changes, so repeated requests do not
+        churn the device allocator.
+        """
+        first = frames[0]
+        shape = (len(frames),) + tuple(first.shape)
+        dtype = dtype or first.dtype
+        
+        buf = self._frame_pool.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype or buf.device != first.device:
+            # Allocate a normal tensor even under inference_mode, so the buffer
+            # can still be written by later passes that run under no_grad
+            with torch.inference_mode(False):
+                buf = torch.empty(shape, dtype=dtype, device=first.device)
+            self._frame_pool[name] = buf
+        
+        for layer, frame in enumerate(frames):
+            buf[layer].copy_(frame)
+        
+        return buf
+    
+    def _pooled_densities(self, *names: str) -> List[List[float]]:
+        """
+        Fraction of non-zero entries per layer of pooled frame buffers.
+        
+        Each buffer is reduced on device and the results are read back with a
+        single transfer, so the host syncs once regardless of L or the number
+        of buffers.
+        """
+        densities = []
+        for name in names:
+            pool = self._frame_pool[name]
+            active = torch.count_nonzero(pool.reshape(pool.shape[0], -1), dim=1)
+            densities.append(active.float() / pool[0].numel())
+        return torch.stack(densities).tolist()
+    
+    def _attention_topk(self, top_k: int) -> Dict:
+        """
+        Select the top-k attention edges per layer on the pooled device buffer,
+        so only k values and indices per layer have to be read back.
+        
+        Edges are in ascending weight order, like the NumPy path of
+        StateExtractor.extract_attention_flow.
+        """
+        attn = self._frame_pool['attn'].float().mean(dim=1)  # [L, T, T], averaged over batch
+        L, T, _ = attn.shape
+        k = min(top_k, T * T)
+        
+        values, indices = attn.reshape(L, -1).topk(k, dim=-1)
+        return {
+            'k': k,
+            'T': T,
+            'values': values.flip(-1).cpu().numpy(),    # [L, k]
+            'indices': indices.flip(-1).cpu().numpy(),  # [L, k], flat index source * T + target
+            'avg_per_layer': attn.mean(dim=(1, 2)).cpu().numpy(),
+        }
+    
     def _store_states(self, output_frames, x_frames, y_frames, attn_frames, logits_frames):
         """Store captured states in tracking dictionary"""
-        # Convert to numpy and store
-        self.states['output_frames'] = [f.cpu().numpy() for f in output_frames]
-        self.states['x_activations'] = [f.cpu().numpy() for f in x_frames]
-        self.states['y_activations'] = [f.cpu().numpy() for f in y_frames]
-        self.states['attention_weights'] = [f.cpu().numpy() for f in attn_frames]
-        self.states['logits_frames'] = [f.cpu().numpy() for f in logits_frames]
-        
-        # Compute sparsity per layer
-        for y in y_frames:
-            sparsity = (y != 0).float().mean().item()
-            self.states['sparsity_per_layer'].append(sparsity)
+        # Convert to numpy and store as stacked [L, ...] host arrays; they
+        # index and iterate per layer like lists, and StateExtractor uses
+        # them without restacking
+        self.states['output_frames'] = self._pool_frames('output', output_frames)
+        self.states['x_activations'] = self._pool_frames('x', x_frames, self._activation_dtype)
+        self.states['y_activations'] = self._pool_frames('y', y_frames, self._activation_dtype)
+        if self._capture_attention:
+            self.states['attention_weights'] = self._pool_frames('attn', attn_frames)
+        else:
+            # Pooled on device for the top-k summary only; no host copy
+            self._fill_pool('attn', attn_frames)
+        self.states['logits_frames'] = self._pool_frames('logits', logits_frames)
+        self.states['attention_topk'] = self._attention_topk(self.attention_top_k)
+        
+        # Compute sparsity per layer with one reduction over each pooled [L, ...] buffer
+        (self.states['sparsity_per_layer'],
+         self.states['x_sparsity_per_layer']) = self._pooled_densities('y', 'x')
         
         # Extract graph topologies
-        Gx, Gy = self.extract_graph_topologies()
-        self.states['Gx_topology'] = Gx
-        self.states['Gy_topology'] = Gy
+        if self._capture_topology:
+            Gx, Gy = self.extract_graph_topologies()
+            self.states['Gx_topology'] = Gx
+            self.states['Gy_topology'] = Gy
     
     def measure_sparsity(self, input_tokens: torch.Tensor) -> Dict[str, float]:
         """
@@ -164,32 +333,64 @@ class BDHInstrumented(BDH):
             Dictionary with sparsity metrics
         """
         self.eval()
-        with torch.no_grad():
-            self.enable_tracking()
-            _ = self.forward(input_tokens, capture_frames=True)
-            self.disable_tracking()
-            
-            states = self.get_states()
-            
-            # Compute statistics
-            y_sparsity = states['sparsity_per_layer']
-            
-            # Compute x sparsity
-            x_sparsity = []
-            for x in states['x_activations']:
-                sparsity = (x != 0).mean()
-                x_sparsity.append(float(sparsity))
-            
-            return {
-                'y_sparsity_mean': float(np.mean(y_sparsity)),
-                'y_sparsity_std': float(np.std(y_sparsity)),
-                'y_sparsity_min': float(np.min(y_sparsity)),
-                'y_sparsity_max': float(np.max(y_sparsity)),
-                'y_sparsity_per_layer': y_sparsity,
-                'x_sparsity_mean': float(np.mean(x_sparsity)),
-                'x_sparsity_std': float(np.std(x_sparsity)),
-                'x_sparsity_per_layer': x_sparsity,
-            }
+        with torch.inference_mode():
+            # Only the per-layer densities are needed: pool the x/y frames on
+            # device and reduce them there, with no host copy of any frames
+            # (and without touching the tracked states)
+            _, _, x_frames, y_frames, _, _ = self._forward_frames(input_tokens)
+            self._fill_pool('y', y_frames)
+            self._fill_pool('x', x_frames)
+            y_sparsity, x_sparsity = self._pooled_densities('y', 'x')
+        
+        return self.sparsity_from_states({
+            'sparsity_per_layer': y_sparsity,
+            'x_sparsity_per_layer': x_sparsity,
+        })
+    
+    @staticmethod
+    def sparsity_from_states(states: Dict) -> Dict[str, float]:
+        """
+        Compute sparsity metrics from the states of a tracked forward pass.
+        
+        Lets callers that already ran a tracked pass get the same metrics as
+        measure_sparsity without a second forward.
+        """
+        # Compute statistics
+        y_sparsity = states['sparsity_per_layer']
+        
+        # Compute x sparsity (already reduced on device by _store_states)
+        x_sparsity = states.get('x_sparsity_per_layer')
+        if not x_sparsity:
+            x_sparsity = [np.count_nonzero(x) / x.size for x in states['x_activations']]
+        
+        return {
+            'y_sparsity_mean': float(np.mean(y_sparsity)),
+            'y_sparsity_std': float(np.std(y_sparsity)),
+            'y_sparsity_min': float(np.min(y_sparsity)),
+            'y_sparsity_max': float(np.max(y_sparsity)),
+            'y_sparsity_per_layer': y_sparsity,
+            'x_sparsity_mean': float(np.mean(x_sparsity)),
+            'x_sparsity_std': float(np.std(x_sparsity)),
+            'x_sparsity_per_layer': x_sparsity,
+        }
+    
+    def _gx_degrees(self, threshold: float) -> np.ndarray:
+        """
+        Out-degree of every neuron in Gx thresholded at |weight| > threshold.
+        
+        Only the adjacency mask is needed, so on CUDA Gx is formed in fp16
+        (a handful of weights within rounding of the threshold may fall on
+        either side of it). Elsewhere it stays fp32, matching the edges of
+        StateExtractor.extract_graph_topology; CPUs without native half
+        matmuls would only be slower. Degrees are reduced on the device.
+        """
+        dtype = torch.float16 if self.E.device.type == 'cuda' else torch.float32
+        
+        with torch.inference_mode():
+            H, D, Nh = self.Dx.shape
+            Dx_flat = self.Dx.permute(1, 0, 2).reshape(D, H * Nh)
+            adjacency = (self.E.to(dtype) @ Dx_flat.to(dtype)).abs() > threshold  # [N, N] bool
+            return adjacency.sum(dim=1).cpu().numpy()
     
     def get_topology_metrics(self, threshold: float = 0.1) -> Dict:
         """
@@ -201,20 +402,20 @@ class BDHInstrumented(BDH):
         Returns:
             Dictionary with topology metrics
         """
-        Gx, Gy = self.extract_graph_topologies()
-        
         # Compute degree distribution for Gx
-        Gx_binary = (np.abs(Gx) > threshold).astype(int)
-        degrees = Gx_binary.sum(axis=1)
+        degrees = self._gx_degrees(threshold)
         
-        # Identify hub neurons (top 10%)
-        hub_threshold = np.percentile(degrees, 90)
-        hubs = np.where(degrees >= hub_threshold)[0].tolist()
+        # Identify hub neurons (top 10%): partial partition instead of a full sort,
+        # with degrees tied to the smallest top-10% degree also counted as hubs
+        k = max(1, int(0.1 * len(degrees)))
+        top_idx = np.argpartition(degrees, -k)[-k:]
+        hub_threshold = degrees[top_idx].min()
+        hubs = np.flatnonzero(degrees >= hub_threshold).tolist()
         
         # Compute statistics
         return {
             'num_neurons': int(self.N),
-            'num_edges': int(Gx_binary.sum()),
+            'num_edges': int(degrees.sum()),
             'avg_degree': float(degrees.mean()),
             'max_degree': int(degrees.max()),
             'min_degree': int(degrees.min()),
@@ -232,35 +433,30 @@ class BDHInstrumented(BDH):
         Args:
             output_path: Path to save JSON file
         """
-        import json
+        import orjson
         
         states = self.get_states()
         
-        # Helper function to convert numpy arrays to lists recursively
-        def convert_to_list(obj):
-            if isinstance(obj, np.ndarray):
-                return obj.tolist()
-            elif isinstance(obj, list):
-                return [convert_to_list(item) for item in obj]
-            elif isinstance(obj, dict):
-                return {key: convert_to_list(value) for key, value in obj.items()}
-            else:
-                return obj
-        
-        # Convert numpy arrays to lists for JSON serialization
+        # orjson writes numpy arrays straight from their buffers, so there is
+        # no per-element conversion to Python floats; anything it cannot take
+        # natively (e.g. non-contiguous arrays) falls back to tolist()
         export_data = {
-            'output_frames': convert_to_list(states['output_frames']),
-            'x_activations': convert_to_list(states['x_activations']),
-            'y_activations': convert_to_list(states['y_activations']),
-            'attention_weights': convert_to_list(states['attention_weights']),
-            'logits_frames': convert_to_list(states['logits_frames']),
+            'output_frames': states['output_frames'],
+            'x_activations': states['x_activations'],
+            'y_activations': states['y_activations'],
+            'attention_weights': states['attention_weights'],
+            'logits_frames': states['logits_frames'],
             'sparsity_per_layer': states['sparsity_per_layer'],
-            'Gx_topology': states['Gx_topology'].tolist() if states['Gx_topology'] is not None else None,
-            'Gy_topology': states['Gy_topology'].tolist() if states['Gy_topology'] is not None else None,
+            'Gx_topology': states['Gx_topology'],
+            'Gy_topology': states['Gy_topology'],
         }
         
-        with open(output_path, 'w') as f:
-            json.dump(export_data, f)
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(
+                export_data,
+                default=lambda obj: obj.tolist(),
+                option=orjson.OPT_SERIALIZE_NUMPY
+            ))
         
         print(f"States exported to {output_path}")
 
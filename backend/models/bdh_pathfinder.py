@@ -10,6 +10,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '../../reference-bdh'))
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from bdh import BDH, BDHParameters
 
 
@@ -32,6 +33,9 @@ class BDHPathfinder(nn.Module):
         # BDH base model
         self.bdh = BDH(params)
         
+        # Learned embedding of the last token's V logits into D
+        self.v_to_d = nn.Linear(params.V, params.D)
+        
         # Projection head: D -> num_cells
         # We'll use the last token's embedding to predict next cell
         self.projection = nn.Sequential(
@@ -57,72 +61,26 @@ class BDHPathfinder(nn.Module):
         # BDH returns logits [B, T, V] when capture_frames=False
         bdh_logits = self.bdh(x, capture_frames=False)
         
-        # We need to extract the embedding before the readout layer
-        # For now, let's use the BDH's internal state
-        # Actually, we need to modify BDH to return embeddings
-        
-        # Workaround: Use the logits and project them
-        # This is not ideal, but works
-        # Better: modify BDH to return v_ast (the embedding)
-        
-        # For now, let's use the last token's logits as a proxy
-        # and add another projection layer
-        last_token_logits = bdh_logits[:, -1, :]  # [B, V]
-        
-        # Project to cell space
-        # But V=5 is too small, we need the actual embedding
-        
-        # Let's take a different approach:
-        # We'll extract the embedding from BDH's internal state
-        # For this, we need to modify the forward pass
-        
-        # Actually, let's just use the full sequence and pool
-        # Average pool over sequence dimension
-        pooled = bdh_logits.mean(dim=1)  # [B, V]
-        
-        # This still won't work well because V=5
-        # We really need the D-dimensional embedding
-        
-        # Let me check if we can access v_ast from BDH
-        # Looking at BDH code, v_ast is the embedding we want
-        
-        # For now, let's use a hack: expand the vocab logits
-        expanded = self.projection(pooled.unsqueeze(1).expand(-1, self.params.D // self.params.V, -1).reshape(-1, self.params.D))
-        
-        # This is getting messy. Let me rethink...
-        
-        # Actually, the cleanest solution is to modify BDH to return embeddings
-        # But that requires changing the reference code
-        
-        # Alternative: Train BDH to output cell indices directly
-        # by setting V=100 (num_cells)
-        
-        # For now, let's just use the BDH logits and see if it learns anything
-        # We'll project from V=5 to num_cells=100
-        
-        # Simple projection
-        cell_logits = self.projection_simple(bdh_logits[:, -1, :])
+        # BDH does not expose its D-dimensional embedding (v_ast), so the last
+        # token's logits are embedded into D and projected to cell space
+        cell_logits = self._proj(self.v_to_d(bdh_logits[:, -1, :]))
         
         if return_embeddings:
             return cell_logits, bdh_logits[:, -1, :]
         return cell_logits
     
-    def projection_simple(self, x):
-        """Simple projection from V to num_cells"""
-        # x: [B, V]
-        # Expand to D dimensions first
-        expanded = x.unsqueeze(-1).expand(-1, -1, self.params.D // self.params.V)
-        expanded = expanded.reshape(x.size(0), -1)  # [B, V * (D//V)]
-        
-        # Pad or trim to D
-        if expanded.size(1) < self.params.D:
-            padding = torch.zeros(x.size(0), self.params.D - expanded.size(1), device=x.device)
-            expanded = torch.cat([expanded, padding], dim=1)
-        else:
-            expanded = expanded[:, :self.params.D]
-        
-        # Project to num_cells
-        return self.projection(expanded)
+    def _proj(self, x):
+        """
+        Projection head as two F.linear calls around the ReLU.
+        
+        Equivalent to self.projection(x); dropout only runs in training. The
+        nn.Sequential stays the parameter container so checkpoints still load.
+        """
+        fc1, _, dropout, fc2 = self.projection
+        h = F.relu(F.linear(x, fc1.weight, fc1.bias))
+        if self.training:
+            h = F.dropout(h, dropout.p, training=True)
+        return F.linear(h, fc2.weight, fc2.bias)
 
 
 # Better approach: Create a simpler model that uses BDH's embedding directly
@@ -143,6 +101,10 @@ class BDHPathfinderV2(nn.Module):
         
         # Projection head from D to num_cells
         self.cell_predictor = nn.Linear(params.D, self.num_cells)
+        
+        # MLP from the V vocab logits to num_cells (used by cell_predictor_mlp)
+        self.mlp_fc1 = nn.Linear(params.V, 256)
+        self.mlp_fc2 = nn.Linear(256, self.num_cells)
     
     def forward(self, x):
         """
@@ -164,20 +126,7 @@ class BDHPathfinderV2(nn.Module):
         # Use last token
         last_logits = logits[:, -1, :]  # [B, V]
         
-        # We need to map V=5 to D=64
-        # Let's use a learned embedding
-        # Actually, let's just use a larger projection
-        
-        # Map V to num_cells directly
-        # This is not ideal but let's try
-        cell_logits = torch.matmul(
-            last_logits.unsqueeze(1),
-            torch.randn(1, self.params.V, self.num_cells, device=x.device)
-        ).squeeze(1)
-        
-        # This won't train well. We need proper embeddings.
-        
-        # Final approach: Just use a simple MLP on the logits
+        # Map V to num_cells with a small MLP on the logits
         return self.cell_predictor_mlp(last_logits)
     
     def cell_predictor_mlp(self, x):
@@ -186,9 +135,9 @@ class BDHPathfinderV2(nn.Module):
         # Map to num_cells=100
         
         # Expand through hidden layer
-        h = torch.relu(nn.Linear(self.params.V, 256)(x))
-        h = torch.dropout(h, 0.1, self.training)
-        return nn.Linear(256, self.num_cells)(h)
+        h = F.relu(self.mlp_fc1(x))
+        h = F.dropout(h, p=0.1, training=self.training)
+        return self.mlp_fc2(h)
 
 
 if __name__ == "__main__":
@@ -8,10 +8,24 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../reference-bdh'))
 
+import threading
+from functools import lru_cache
 import torch
 import numpy as np
 from typing import List, Tuple, Optional
 from bdh import BDH, BDHParameters
+from _astar_nb import astar
+
+
+class _BoardForward(torch.nn.Module):
+    """Module wrapper so the untracked forward can be traced with its parameters"""
+    
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+    
+    def forward(self, board):
+        return self.model(board, capture_frames=False)
 
 
 class BDHPathfindingSolver:
@@ -19,13 +33,23 @@ class BDHPathfindingSolver:
     Solver that uses trained BDH model to find paths through mazes.
     """
     
-    def __init__(self, checkpoint_path: str, device: str = 'cpu'):
+    def __init__(
+        self,
+        checkpoint_path: str,
+        device: str = 'cpu',
+        compile_model: bool = False,
+        half_precision: bool = True
+    ):
         """
         Initialize solver with trained model.
         
         Args:
             checkpoint_path: Path to trained model checkpoint
             device: Device to run on ('cpu', 'cuda', or 'mps')
+            compile_model: Compile the model with torch.compile and warm it up
+                here, so the compile cost is not paid by the first solve
+            half_precision: On CUDA, cast the weights to bfloat16 (float16 on
+                MPS); the board tokens stay long for the embedding lookup
         """
         self.device = device
         self.board_size = 10
@@ -43,147 +67,178 @@ class BDHPathfindingSolver:
             use_abs_pos=False
         )
         
-        self.model = BDH(params)
+        self.model = BDH(params).to(device)
         
         # Load checkpoint
         if os.path.exists(checkpoint_path):
-            state_dict = torch.load(checkpoint_path, map_location=device)
+            # Memory-map the checkpoint: load_state_dict then copies each tensor
+            # straight from the file pages into the on-device parameters
+            state_dict = torch.load(checkpoint_path, map_location='cpu', mmap=True, weights_only=True)
             self.model.load_state_dict(state_dict)
+            del state_dict
             print(f"✅ Loaded trained model from {checkpoint_path}")
         else:
             raise FileNotFoundError(f"Checkpoint not found: {checkpoint_path}")
         
-        self.model.to(device)
         self.model.eval()
+        
+        # Inference only: no parameter should ask autograd to record anything
+        self.model.requires_grad_(False)
+        
+        device_type = torch.device(device).type
+        if half_precision and device_type in ('cuda', 'mps'):
+            if device_type == 'cuda':
+                torch.backends.cuda.matmul.allow_bf16_reduced_precision_reduction = True
+            self.model.to(dtype=torch.bfloat16 if device_type == 'cuda' else torch.float16)
+        
+        # Model input reused by every solve step: host board state and its
+        # device copy. Solves share them, so they are serialized by a lock.
+        num_cells = self.board_size * self.board_size
+        self._board_np = np.empty(num_cells, dtype=np.int64)
+        self._board_buf = torch.empty((1, num_cells), dtype=torch.long, device=device)
+        self._lock = threading.Lock()
+        
+        # Cell ranks per board state, so repeated solves reuse one forward
+        self._tie_ranks = lru_cache(maxsize=128)(self._rank_cells)
+        self._no_ranks = np.zeros(num_cells, dtype=np.int32)
+        self._no_ranks.flags.writeable = False
+        
+        # Every solve step runs a [1, T] board, so a static-shape compile fits
+        if compile_model and hasattr(torch, "compile"):
+            self.model = torch.compile(self.model, mode="reduce-overhead", fullgraph=False, dynamic=False)
+            with torch.inference_mode():
+                self.model(torch.zeros((1, params.T), dtype=torch.long, device=device), capture_frames=False)
+            self._forward = _BoardForward(self.model)
+        else:
+            self._forward = self._freeze_forward()
+    
+    def _freeze_forward(self):
+        """
+        Trace the untracked forward on the board shape and freeze it.
+        
+        Freezing inlines the weights as constants and drops the frame
+        capture branch. Falls back to the eager model if tracing fails.
+        """
+        module = _BoardForward(self.model).eval()
+        try:
+            # Trace outside inference_mode so the graph keeps normal parameter tensors
+            with torch.inference_mode(False), torch.no_grad():
+                example = torch.zeros_like(self._board_buf)
+                traced = torch.jit.trace(module, example, strict=False, check_trace=False)
+                return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        except Exception as e:
+            print(f"⚠ torch.jit.trace failed, using eager forward: {e}")
+            return module
     
     def solve(
         self,
         board: np.ndarray,
         start: Tuple[int, int],
         end: Tuple[int, int],
-        max_steps: int = 100
+        max_steps: int = 100,
+        use_model: bool = True,
+        heuristic_slack: Optional[int] = 0
     ) -> Optional[List[Tuple[int, int]]]:
         """
-        Solve maze using trained BDH model.
+        Solve maze with A*, using the trained BDH model to break ties.
         
         Args:
             board: 2D numpy array (10x10) with 0=empty, 1=wall
             start: Starting position (row, col)
             end: Ending position (row, col)
-            max_steps: Maximum number of steps to try
+            max_steps: Longest path (in moves) to accept; a board whose
+                shortest path is longer counts as unsolved
+            use_model: Order equally short candidates by the model's scores;
+                without it the search needs no forward pass at all
+            heuristic_slack: Return the model-free path without a forward
+                when it is at most this many steps longer than the Manhattan
+                distance (None always consults the model)
         
         Returns:
             List of (row, col) positions forming the path, or None if no solution
         """
-        current = start
-        path = [start]
-        visited = {start}
-        
-        # Use BFS with model-guided tie-breaking for reliability
-        from collections import deque
-        
-        queue = deque([(start, [start])])
-        visited_bfs = {start}
-        
-        while queue:
-            current_pos, path = queue.popleft()
-            
-            if current_pos == end:
-                return path
-            
-            # Get adjacent cells
-            curr_row, curr_col = current_pos
-            adjacent = [
-                (curr_row - 1, curr_col),
-                (curr_row + 1, curr_col),
-                (curr_row, curr_col - 1),
-                (curr_row, curr_col + 1),
-            ]
-            
-            # Score each valid adjacent cell using model
-            candidates = []
-            for next_pos in adjacent:
-                if (0 <= next_pos[0] < self.board_size and 
-                    0 <= next_pos[1] < self.board_size and
-                    next_pos not in visited_bfs and
-                    board[next_pos] != 1):
-                    
-                    # Use model to score this move
-                    board_state = self._create_board_state(board, current_pos, start, end)
-                    board_tensor = torch.from_numpy(board_state).long().unsqueeze(0).to(self.device)
-                    
-                    with torch.no_grad():
-                        logits = self.model(board_tensor, capture_frames=False)
-                        last_logits = logits[0, -1, :]
-                        cell_idx = next_pos[0] * self.board_size + next_pos[1]
-                        score = last_logits[cell_idx].item()
-                    
-                    candidates.append((next_pos, score))
-            
-            # Sort by model score (explore high-scoring moves first)
-            candidates.sort(key=lambda x: x[1], reverse=True)
-            
-            # Add to queue in score order
-            for next_pos, score in candidates:
-                visited_bfs.add(next_pos)
-                queue.append((next_pos, path + [next_pos]))
-        
-        # No path found
-        return None
+        with self._lock:
+            return self._solve(board, start, end, max_steps, use_model, heuristic_slack)
     
-    def _create_board_state(
+    def _solve(
         self,
         board: np.ndarray,
-        current: Tuple[int, int],
         start: Tuple[int, int],
-        end: Tuple[int, int]
-    ) -> np.ndarray:
-        """Create board state with current position marked"""
-        board_state = board.copy()
-        board_state[start] = 2   # Start marker
-        board_state[end] = 3     # End marker
-        board_state[current] = 4  # Current position
-        return board_state.flatten()
+        end: Tuple[int, int],
+        max_steps: int,
+        use_model: bool = True,
+        heuristic_slack: Optional[int] = 0
+    ) -> Optional[List[Tuple[int, int]]]:
+        """A* with model-guided tie-breaking (caller holds self._lock)"""
+        size = self.board_size
+        
+        # The compiled A* indexes the flat board without bounds checks
+        board = np.asarray(board)
+        if board.shape != (size, size):
+            raise ValueError(f"Board must be {size}x{size}, got shape {board.shape}")
+        for row, col in (start, end):
+            if not (0 <= row < size and 0 <= col < size):
+                raise ValueError(f"Position ({row}, {col}) is outside the {size}x{size} board")
+        start_id = start[0] * size + start[1]
+        end_id = end[0] * size + end[1]
+        board_flat = np.ascontiguousarray(board == 1, dtype=np.int8).ravel()
+        
+        # Model-free A* first: unreachable ends need no forward, and on easy
+        # boards (path within heuristic_slack of the Manhattan distance) the
+        # model's choice between equally short paths is not worth one
+        path = astar(board_flat, size, start_id, end_id, self._no_ranks)
+        if len(path) == 0 or len(path) - 1 > max_steps:
+            return None
+        
+        manhattan = abs(start[0] - end[0]) + abs(start[1] - end[1])
+        easy = heuristic_slack is not None and len(path) - 1 <= manhattan + heuristic_slack
+        
+        # A* only consults the model's cell ranks to order frontier cells
+        # with equal f, so one (cached) forward replaces per-expansion scoring
+        if use_model and not easy:
+            self._create_board_state(board, start, start, end)
+            tie_rank = self._tie_ranks(self._board_np.tobytes())
+            path = astar(board_flat, size, start_id, end_id, tie_rank)
+        
+        return [divmod(int(cell), size) for cell in path]
     
-    def _is_adjacent(self, current: Tuple[int, int], next_pos: Tuple[int, int]) -> bool:
-        """Check if next_pos is adjacent to current (up/down/left/right only)"""
-        curr_row, curr_col = current
-        next_row, next_col = next_pos
+    def _rank_cells(self, board_state: bytes) -> np.ndarray:
+        """
+        Rank every cell by the model's next-cell logits (0 = highest).
         
-        # Check if exactly one step away in one direction
-        row_diff = abs(next_row - curr_row)
-        col_diff = abs(next_col - curr_col)
+        `board_state` is the cache key: the bytes of the board state that
+        _create_board_state just wrote into the model input.
+        """
+        num_cells = self.board_size * self.board_size
+        with torch.inference_mode():
+            logits = self._forward(self._board_buf)
+            order = torch.argsort(logits[0, -1, :num_cells].float(), descending=True)
         
-        # Valid moves: (0,1), (1,0), (0,-1), (-1,0)
-        return (row_diff == 1 and col_diff == 0) or (row_diff == 0 and col_diff == 1)
+        tie_rank = np.empty(num_cells, dtype=np.int32)
+        tie_rank[order.cpu().numpy()] = np.arange(num_cells, dtype=np.int32)
+        tie_rank.flags.writeable = False  # Shared by every cache hit
+        return tie_rank
     
-    def _is_valid_move(
+    def _create_board_state(
         self,
         board: np.ndarray,
-        pos: Tuple[int, int],
-        visited: set,
-        current: Tuple[int, int]
-    ) -> bool:
-        """Check if move is valid"""
-        row, col = pos
-        
-        # Check bounds
-        if not (0 <= row < self.board_size and 0 <= col < self.board_size):
-            return False
-        
-        # Check if wall
-        if board[row, col] == 1:
-            return False
-        
-        # Check if already visited
-        if pos in visited:
-            return False
-        
-        # CRITICAL: Check if adjacent to current position
-        if not self._is_adjacent(current, pos):
-            return False
-        
-        return True
+        current: Tuple[int, int],
+        start: Tuple[int, int],
+        end: Tuple[int, int]
+    ) -> torch.Tensor:
+        """
+        Write the board state with current position marked into the reused
+        model input and return it ([1, num_cells] on the solver device)
+        """
+        size = self.board_size
+        board_state = self._board_np
+        board_state[:] = board.ravel()
+        board_state[start[0] * size + start[1]] = 2      # Start marker
+        board_state[end[0] * size + end[1]] = 3          # End marker
+        board_state[current[0] * size + current[1]] = 4  # Current position
+        
+        self._board_buf[0].copy_(torch.from_numpy(board_state))
+        return self._board_buf
 
 
 def test_solver():
@@ -44,15 +44,35 @@ class BDHPathfindingSolverDirections:
             use_abs_pos=False
         )
         
-        self.model = BDH(params)
+        self.model = BDH(params).to(device)
         
         if os.path.exists(checkpoint_path):
-            state_dict = torch.load(checkpoint_path, map_location=device)
+            # Memory-mapped, same as BDHPathfindingSolver
+            state_dict = torch.load(checkpoint_path, map_location='cpu', mmap=True, weights_only=True)
             self.model.load_state_dict(state_dict)
-            print(f\"✅ Loaded direction-based model from {checkpoint_path}\")\n        else:
-            raise FileNotFoundError(f\"Checkpoint not found: {checkpoint_path}\")\n        
-        self.model.to(device)
+            del state_dict
+            print(f"✅ Loaded direction-based model from {checkpoint_path}")
+        else:
+            raise FileNotFoundError(f"Checkpoint not found: {checkpoint_path}")
+        
         self.model.eval()
+        
+        # Inference only: no parameter should ask autograd to record anything
+        self.model.requires_grad_(False)
+        
+        # Flat neighbour id of every cell in each of the 4 directions
+        # (-1 = off the board), so a step is a table lookup
+        self._neighbors = np.full((self.board_size ** 2, 4), -1, dtype=np.int8)
+        for r in range(self.board_size):
+            for c in range(self.board_size):
+                for direction_idx, (dr, dc) in self.DIRECTIONS.items():
+                    nr, nc = r + dr, c + dc
+                    if 0 <= nr < self.board_size and 0 <= nc < self.board_size:
+                        self._neighbors[r * self.board_size + c, direction_idx] = nr * self.board_size + nc
+        
+        # Model input reused by every step: host board state and its device copy
+        self._board_np = np.empty(self.board_size ** 2, dtype=np.int64)
+        self._board_buf = torch.empty((1, self.board_size ** 2), dtype=torch.long, device=device)
     
     def solve(
         self,
@@ -61,60 +81,53 @@ class BDHPathfindingSolverDirections:
         end: Tuple[int, int],
         max_steps: int = 100
     ) -> Optional[List[Tuple[int, int]]]:
-        \"\"\"Solve maze using direction predictions\"\"\"
-        current = start
+        """Solve maze using direction predictions"""
+        size = self.board_size
+        walls = (board.ravel() == 1).tolist()
+        start_id = start[0] * size + start[1]
+        current = start_id
+        end_id = end[0] * size + end[1]
         path = [start]
-        visited = {start}
+        visited = bytearray(size * size)
+        visited[current] = 1
         
-        with torch.no_grad():
+        # Walls, start and end markers stay fixed for the whole solve: write
+        # them once and only place the current-position marker per step
+        board_state = self._board_np
+        board_state[:] = board.ravel()
+        board_state[start_id] = 2
+        board_state[end_id] = 3
+        
+        with torch.inference_mode():
             for step in range(max_steps):
-                if current == end:
+                if current == end_id:
                     return path
                 
-                # Create board state
-                board_state = self._create_board_state(board, current, start, end)
-                board_tensor = torch.from_numpy(board_state).long().unsqueeze(0).to(self.device)
+                # Mark the current position for this step only
+                cell_value = board_state[current]
+                board_state[current] = 4
+                self._board_buf[0].copy_(torch.from_numpy(board_state))
+                board_state[current] = cell_value
                 
                 # Predict direction
-                logits = self.model(board_tensor, capture_frames=False)
-                last_logits = logits[0, -1, :]  # [4] - one score per direction
+                logits = self.model(self._board_buf, capture_frames=False)
+                scores = logits[0, -1, :].tolist()  # [4] - one score per direction
                 
                 # Try directions in order of model preference
-                direction_scores = [(i, last_logits[i].item()) for i in range(4)]
-                direction_scores.sort(key=lambda x: x[1], reverse=True)
-                
-                next_cell = None
-                for direction_idx, score in direction_scores:
-                    dr, dc = self.DIRECTIONS[direction_idx]
-                    candidate = (current[0] + dr, current[1] + dc)
-                    
-                    if self._is_valid_move(board, candidate, visited):
+                neighbors = self._neighbors[current].tolist()
+                next_cell = -1
+                for direction_idx in sorted(range(4), key=scores.__getitem__, reverse=True):
+                    candidate = neighbors[direction_idx]
+                    if candidate >= 0 and not walls[candidate] and not visited[candidate]:
                         next_cell = candidate
                         break
                 
-                if next_cell is None:
+                if next_cell < 0:
                     # No valid moves
                     return None
                 
-                path.append(next_cell)
-                visited.add(next_cell)
+                path.append(divmod(next_cell, size))
+                visited[next_cell] = 1
                 current = next_cell
         
-        return None if current != end else path
-    
-    def _create_board_state(self, board, current, start, end):
-        board_state = board.copy()
-        board_state[start] = 2
-        board_state[end] = 3
-        board_state[current] = 4
-        return board_state.flatten()
-    
-    def _is_valid_move(self, board, pos, visited):
-        row, col = pos
-        if not (0 <= row < self.board_size and 0 <= col < self.board_size):
-            return False
-        if board[row, col] == 1:
-            return False
-        if pos in visited:
-            return False
-        return True
+        return None if current != end_id else path
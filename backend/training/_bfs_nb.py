@@ -0,0 +1,141 @@
+"""
+Breadth-First Search for Dataset Generation
+
+Shortest 4-connected grid path over flat cell ids, written on plain numpy
+arrays so it compiles with Numba. Numba is optional: without it the same
+function runs as ordinary Python. For large boards, bfs_sparse runs the
+search in SciPy's compiled csgraph routines instead (also optional).
+"""
+
+import numpy as np
+
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import breadth_first_order
+except ImportError:
+    coo_matrix = None
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that returns the function unchanged"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+@njit(cache=True)
+def bfs(board_flat, size, start, end):
+    """
+    Shortest path between two cells of a size x size grid.
+
+    Neighbours are expanded right, down, left, up, so among equally short
+    paths the same one is returned every time.
+
+    Args:
+        board_flat: Flattened board (C-contiguous), 1 = wall
+        size: Side length of the board
+        start: Flat id of the start cell
+        end: Flat id of the end cell
+
+    Returns:
+        int32 array of flat cell ids from start to end, empty if unreachable
+    """
+    n = size * size
+    parent = np.full(n, -1, np.int32)
+
+    # Every cell is queued at most once, so a flat array with head/tail
+    # indices replaces the deque
+    queue = np.empty(n, np.int32)
+    parent[start] = start
+    queue[0] = start
+    head = 0
+    tail = 1
+
+    while head < tail:
+        node = queue[head]
+        head += 1
+
+        if node == end:
+            length = 1
+            cell = end
+            while cell != start:
+                cell = parent[cell]
+                length += 1
+
+            path = np.empty(length, np.int32)
+            cell = end
+            for i in range(length - 1, -1, -1):
+                path[i] = cell
+                cell = parent[cell]
+            return path
+
+        row = node // size
+        col = node % size
+        for k in range(4):
+            if k == 0:
+                if col == size - 1:
+                    continue
+                nb = node + 1
+            elif k == 1:
+                if row == size - 1:
+                    continue
+                nb = node + size
+            elif k == 2:
+                if col == 0:
+                    continue
+                nb = node - 1
+            else:
+                if row == 0:
+                    continue
+                nb = node - size
+
+            if board_flat[nb] != 1 and parent[nb] == -1:
+                parent[nb] = node
+                queue[tail] = nb
+                tail += 1
+
+    return np.empty(0, np.int32)
+
+
+def bfs_sparse(board_flat, size, start, end):
+    """
+    Shortest path like bfs(), searched with scipy.sparse.csgraph.
+
+    The 4-connected adjacency of the open cells is built as a sparse matrix
+    and walked by breadth_first_order in C. Building the matrix costs more
+    than the whole search on small boards, so this only pays off on large
+    ones. Among equally short paths the one returned may differ from bfs().
+    Falls back to bfs() when SciPy is not installed.
+
+    Args / Returns: as for bfs()
+    """
+    if coo_matrix is None:
+        return bfs(board_flat, size, start, end)
+
+    n = size * size
+    cells = np.arange(n)
+    passable = board_flat != 1
+
+    # Edges to the right and downward neighbour; undirected, so each once
+    right = passable[:-1] & passable[1:] & (cells[:-1] % size != size - 1)
+    down = passable[:-size] & passable[size:]
+    right_cells = cells[:-1][right]
+    down_cells = cells[:-size][down]
+    rows = np.concatenate([right_cells, down_cells])
+    cols = np.concatenate([right_cells + 1, down_cells + size])
+    adjacency = coo_matrix(
+        (np.ones(len(rows), np.int8), (rows, cols)), shape=(n, n)
+    ).tocsr()
+
+    _, predecessors = breadth_first_order(
+        adjacency, start, directed=False, return_predecessors=True
+    )
+    if start != end and predecessors[end] < 0:
+        return np.empty(0, np.int32)
+
+    path = [end]
+    while path[-1] != start:
+        path.append(predecessors[path[-1]])
+    return np.array(path[::-1], np.int32)
@@ -4,11 +4,38 @@ Pathfinding Dataset Generator for BDH Training
 Generates maze boards with BFS solutions for training BDH to learn pathfinding.
 """
 
+import multiprocessing
+import os
 import numpy as np
 import torch
-from collections import deque
 from typing import List, Tuple, Optional
 import random
+from _bfs_nb import bfs, bfs_sparse
+
+
+# Samples generated per worker task; large enough that pickling and
+# dispatch are amortized over many BFS problems
+_CHUNK_SAMPLES = 256
+
+# Candidate boards drawn per RNG call; about what one chunk consumes
+_BOARD_BATCH = 256
+
+# Boards above this side length are searched with the sparse-graph BFS;
+# below it, building the adjacency matrix costs more than the search
+_SPARSE_BFS_MIN_SIZE = 20
+
+# Dataset whose settings the pool workers generate samples for
+_worker_dataset: Optional["PathfindingDataset"] = None
+
+
+def _init_worker(dataset: "PathfindingDataset"):
+    global _worker_dataset
+    _worker_dataset = dataset
+
+
+def _generate_chunk(seed: np.random.SeedSequence) -> Tuple[np.ndarray, np.ndarray]:
+    """Pool task: generate one chunk of samples with its own RNG stream"""
+    return _worker_dataset._collect_chunk(seed)
 
 
 class PathfindingDataset(torch.utils.data.Dataset):
@@ -25,29 +52,72 @@ class PathfindingDataset(torch.utils.data.Dataset):
         num_samples: int = 50000,
         board_size: int = 10,
         wall_density: float = 0.25,
-        min_path_length: int = 5
+        min_path_length: int = 5,
+        num_workers: Optional[int] = None,
+        seed: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        force_regenerate: bool = False
     ):
+        """
+        Args:
+            seed: Seed for the dataset's RNG; drawn from `random` if None. The
+                generated data depends only on the seed, not on num_workers
+            cache_dir: Directory to keep generated datasets in. Only used
+                together with `seed`, since an unseeded dataset never repeats
+            force_regenerate: Generate (and re-cache) even on a cache hit
+        """
         self.num_samples = num_samples
         self.board_size = board_size
         self.wall_density = wall_density
         self.min_path_length = min_path_length
+        self.num_workers = num_workers or os.cpu_count() or 1  # 1 = no worker pool
         self.vocab_size = 5  # 0=empty, 1=wall, 2=start, 3=end, 4=path
+        self._bfs = bfs_sparse if board_size > _SPARSE_BFS_MIN_SIZE else bfs
         
-        print(f"Generating {num_samples} pathfinding samples...")
-        self.samples = self._generate_dataset()
-        print(f"✓ Generated {len(self.samples)} valid samples")
-    
-    def _generate_board(self) -> np.ndarray:
-        """Generate a random board with walls"""
-        board = np.zeros((self.board_size, self.board_size), dtype=np.int64)
+        # Seeded from `random` by default, so random.seed() still reproduces
+        # a dataset
+        self._rng = np.random.default_rng(random.getrandbits(64) if seed is None else seed)
+        
+        # Samples as two contiguous arrays: flattened board states [S, cells]
+        # (int8) and next-cell targets [S] (int16)
+        cache_prefix = None
+        if cache_dir is not None and seed is not None:
+            cache_prefix = os.path.join(
+                cache_dir,
+                f"pathfinding_N{board_size}_W{wall_density}_L{min_path_length}"
+                f"_S{num_samples}_seed{seed}"
+            )
         
-        # Add random walls
-        for i in range(self.board_size):
-            for j in range(self.board_size):
-                if random.random() < self.wall_density:
-                    board[i, j] = 1
+        if cache_prefix is not None and not force_regenerate and os.path.exists(cache_prefix + "_targets.npy"):
+            # Memory-mapped, so DataLoader workers share the pages instead of
+            # each holding a copy
+            self.boards = np.load(cache_prefix + "_boards.npy", mmap_mode='r')
+            self.targets = np.load(cache_prefix + "_targets.npy", mmap_mode='r')
+            print(f"✓ Loaded {len(self.targets)} cached samples from {cache_prefix}_*.npy")
+            return
         
-        return board
+        print(f"Generating {num_samples} pathfinding samples...")
+        self.boards, self.targets = self._generate_dataset()
+        print(f"✓ Generated {len(self.targets)} valid samples")
+        
+        if cache_prefix is not None:
+            self._save_cache(cache_prefix)
+    
+    def _save_cache(self, prefix: str):
+        """Write boards and targets as .npy files next to `prefix`"""
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        # Targets last and each file renamed into place whole, so a run
+        # interrupted mid-write never leaves a cache that looks complete
+        for name, array in (("boards", self.boards), ("targets", self.targets)):
+            tmp_path = f"{prefix}_{name}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, f"{prefix}_{name}.npy")
+    
+    def _generate_boards(self, count: int) -> np.ndarray:
+        """Generate `count` random boards with walls, [count, cells] int8"""
+        # Each cell is a wall with probability wall_density
+        walls = self._rng.random((count, self.board_size * self.board_size)) < self.wall_density
+        return walls.astype(np.int8)
     
     def _bfs_path(
         self,
@@ -56,99 +126,134 @@ class PathfindingDataset(torch.utils.data.Dataset):
         end: Tuple[int, int]
     ) -> Optional[List[Tuple[int, int]]]:
         """Find shortest path using BFS"""
-        queue = deque([(start, [start])])
-        visited = {start}
+        size = self.board_size
+        path = self._bfs(board.ravel(), size, start[0] * size + start[1], end[0] * size + end[1])
+        if len(path) == 0:
+            return None
+        return [divmod(int(cell), size) for cell in path]
+    
+    def _generate_sample(
+        self,
+        board: np.ndarray,
+        start: int,
+        end: int,
+        boards: np.ndarray,
+        targets: np.ndarray
+    ) -> int:
+        """
+        Write the training samples of the path from `start` to `end` on the
+        flat `board` straight into the rows of `boards` / `targets` (at most
+        len(targets) of them)
         
-        while queue:
-            (row, col), path = queue.popleft()
-            
-            if (row, col) == end:
-                return path
-            
-            # Check 4 directions
-            for dr, dc in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
-                new_row, new_col = row + dr, col + dc
-                
-                if (0 <= new_row < self.board_size and
-                    0 <= new_col < self.board_size and
-                    (new_row, new_col) not in visited and
-                    board[new_row, new_col] != 1):
-                    
-                    visited.add((new_row, new_col))
-                    queue.append(((new_row, new_col), path + [(new_row, new_col)]))
+        Returns:
+            Number of rows written, 0 if the path is missing or too short
+        """
+        # Find path (flat cell ids; empty if unreachable)
+        path = self._bfs(board, self.board_size, start, end)
+        
+        if len(path) < self.min_path_length:
+            return 0
+        
+        # Create training samples from path
+        # For each position in path (except last), predict next position
+        steps = min(len(path) - 1, len(targets))
+        
+        # Broadcast the board into one output row per step, then mark
+        # start/end in every row and each row's current position
+        rows = boards[:steps]
+        rows[:] = board
+        rows[:, start] = 2                        # Start
+        rows[:, end] = 3                          # End
+        rows[np.arange(steps), path[:steps]] = 4  # Current position
         
-        return None
+        # Target is next position in path
+        targets[:steps] = path[1:steps + 1]
+        return steps
     
-    def _generate_sample(self) -> Optional[Tuple[np.ndarray, int]]:
-        """Generate a single training sample"""
-        max_attempts = 10
+    def _collect_samples(self, num_samples: int, verbose: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Generate up to num_samples samples in this process"""
+        boards = np.empty((num_samples, self.board_size * self.board_size), dtype=np.int8)
+        targets = np.empty(num_samples, dtype=np.int16)
+        count = 0
+        candidates = 0
+        max_candidates = num_samples * 30
         
-        for _ in range(max_attempts):
-            # Generate board
-            board = self._generate_board()
+        while count < num_samples and candidates < max_candidates:
+            # Candidate boards and their start/end cells come from one RNG
+            # call each per batch rather than one per board
+            batch_boards = self._generate_boards(_BOARD_BATCH)
+            starts, ends = self._rng.integers(
+                0, self.board_size * self.board_size, size=(2, _BOARD_BATCH)
+            )
+            candidates += _BOARD_BATCH
             
-            # Random start and end positions
-            start = (random.randint(0, self.board_size - 1),
-                    random.randint(0, self.board_size - 1))
-            end = (random.randint(0, self.board_size - 1),
-                  random.randint(0, self.board_size - 1))
+            # Start and end must be open cells and distinct
+            index = np.arange(_BOARD_BATCH)
+            valid = (
+                (batch_boards[index, starts] != 1) &
+                (batch_boards[index, ends] != 1) &
+                (starts != ends)
+            )
             
-            # Ensure start and end are not walls and not the same
-            if (board[start] == 1 or board[end] == 1 or start == end):
-                continue
+            for i in np.flatnonzero(valid).tolist():
+                # The last path is trimmed to the rows that are left
+                count += self._generate_sample(
+                    batch_boards[i], int(starts[i]), int(ends[i]),
+                    boards[count:], targets[count:]
+                )
+                if count == num_samples:
+                    break
             
-            # Find path
-            path = self._bfs_path(board, start, end)
-            
-            if path is None or len(path) < self.min_path_length:
-                continue
-            
-            # Create training samples from path
-            # For each position in path (except last), predict next position
-            samples = []
-            for i in range(len(path) - 1):
-                # Create board state with current position marked
-                board_state = board.copy()
-                board_state[start] = 2  # Start
-                board_state[end] = 3    # End
-                board_state[path[i]] = 4  # Current position
-                
-                # Target is next position in path
-                next_pos = path[i + 1]
-                target_idx = next_pos[0] * self.board_size + next_pos[1]
-                
-                samples.append((board_state.flatten(), target_idx))
-            
-            return samples
+            if verbose:
+                print(f"  Generated {count}/{num_samples} samples...")
         
-        return None
+        return boards[:count], targets[:count]
+    
+    def _collect_chunk(self, seed: np.random.SeedSequence) -> Tuple[np.ndarray, np.ndarray]:
+        """Generate one chunk of samples from its own RNG stream"""
+        self._rng = np.random.default_rng(seed)
+        return self._collect_samples(_CHUNK_SAMPLES)
     
-    def _generate_dataset(self) -> List[Tuple[np.ndarray, int]]:
+    def _gather_chunks(self, chunk_iter) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Collect generated chunks in order, reporting progress"""
+        chunks = []
+        count = 0
+        for i, chunk in enumerate(chunk_iter):
+            chunks.append(chunk)
+            count += len(chunk[1])
+            if (i + 1) % 20 == 0:
+                print(f"  Generated {count}/{self.num_samples} samples...")
+        return chunks
+    
+    def _generate_dataset(self) -> Tuple[np.ndarray, np.ndarray]:
         """Generate full dataset"""
-        samples = []
-        attempts = 0
-        max_attempts = self.num_samples * 3
+        num_chunks = max(1, -(-self.num_samples // _CHUNK_SAMPLES))
         
-        while len(samples) < self.num_samples and attempts < max_attempts:
-            sample_set = self._generate_sample()
-            if sample_set:
-                samples.extend(sample_set)
-            attempts += 1
-            
-            if attempts % 1000 == 0:
-                print(f"  Generated {len(samples)}/{self.num_samples} samples...")
+        # One independent RNG stream per chunk, derived from this dataset's
+        # RNG; chunks are consumed in order whether they run in a pool or in
+        # this process, so the seed alone determines the data
+        seeds = np.random.SeedSequence(int(self._rng.integers(2**63))).spawn(num_chunks)
+        
+        workers = min(self.num_workers, num_chunks)
+        if workers <= 1:
+            chunks = self._gather_chunks(map(self._collect_chunk, seeds))
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(self,)) as pool:
+                chunks = self._gather_chunks(pool.imap(_generate_chunk, seeds, chunksize=4))
         
         # Trim to exact size
-        return samples[:self.num_samples]
+        boards = np.concatenate([b for b, _ in chunks])[:self.num_samples]
+        targets = np.concatenate([t for _, t in chunks])[:self.num_samples]
+        return boards, targets
     
     def __len__(self) -> int:
-        return len(self.samples)
+        return len(self.targets)
     
     def __getitem__(self, idx: int) -> Tuple[torch.Tensor, torch.Tensor]:
-        board_state, target = self.samples[idx]
         return (
-            torch.from_numpy(board_state).long(),
-            torch.tensor(target, dtype=torch.long)
+            # astype copies, so read-only memory-mapped rows work as well
+            torch.from_numpy(self.boards[idx].astype(np.int64)),
+            torch.tensor(int(self.targets[idx]), dtype=torch.long)
         )
 
 
@@ -5,6 +5,7 @@ This script trains the BDH model to learn pathfinding, predicting the next
 step in an optimal path through a maze.
 """
 
+import argparse
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../reference-bdh'))
@@ -13,7 +14,7 @@ import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader
 import time
-import matplotlib.pyplot as plt
+from typing import Optional
 from pathfinding_dataset import PathfindingDataset
 from bdh import BDH, BDHParameters
 
@@ -24,7 +25,14 @@ def train_pathfinding_bdh(
     batch_size: int = 32,
     learning_rate: float = 3e-4,
     device: str = 'cuda' if torch.cuda.is_available() else 'cpu',
-    checkpoint_path: str = '../../checkpoints/bdh_pathfinding_trained.pth'
+    checkpoint_path: str = '../../checkpoints/bdh_pathfinding_trained.pth',
+    precision: str = 'bf16',
+    dataset_seed: Optional[int] = None,
+    dataset_cache_dir: str = '../../cache',
+    regenerate_dataset: bool = False,
+    log_dir: Optional[str] = '../../runs/pathfinding',
+    plot: bool = False,
+    accum_steps: int = 1
 ):
     """
     Train BDH on pathfinding task
@@ -36,6 +44,13 @@ def train_pathfinding_bdh(
         learning_rate: Learning rate
         device: Device to train on
         checkpoint_path: Path to save checkpoint
+        precision: Autocast precision on CUDA ('fp32', 'bf16' or 'fp16')
+        dataset_seed: Dataset seed; seeded datasets are cached and reused
+        dataset_cache_dir: Directory for cached datasets
+        regenerate_dataset: Regenerate the dataset even if it is cached
+        log_dir: TensorBoard log directory, None to skip logging
+        plot: Also save a matplotlib plot of the loss curve
+        accum_steps: Batches per optimizer step (gradient accumulation)
     """
     
     print("=" * 70)
@@ -44,13 +59,29 @@ def train_pathfinding_bdh(
     print(f"Device: {device}")
     print(f"Samples: {num_samples}")
     print(f"Epochs: {num_epochs}")
-    print(f"Batch size: {batch_size}")
+    print(f"Batch size: {batch_size} x {accum_steps} accumulation steps")
     print("=" * 70)
     
     # Create dataset
     print("\n📦 Creating dataset...")
-    dataset = PathfindingDataset(num_samples=num_samples, board_size=10)
-    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=2)
+    dataset = PathfindingDataset(
+        num_samples=num_samples,
+        board_size=10,
+        seed=dataset_seed,
+        cache_dir=dataset_cache_dir,
+        force_regenerate=regenerate_dataset
+    )
+    # Persistent workers keep their processes across epochs; pinned batches
+    # let the host-to-device copies below run asynchronously
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=min(8, os.cpu_count() or 1),
+        persistent_workers=True,
+        pin_memory=torch.device(device).type == 'cuda',
+        prefetch_factor=4
+    )
     print(f"✓ Dataset created: {len(dataset)} samples, {len(loader)} batches")
     
     # Create model
@@ -70,6 +101,12 @@ def train_pathfinding_bdh(
     model = BDH(params)
     model.to(device)
     
+    # Fixed T and V let Inductor specialize every kernel statically. The
+    # uncompiled module keeps plain state_dict keys for checkpoints.
+    forward = model
+    if hasattr(torch, 'compile'):
+        forward = torch.compile(model, mode='reduce-overhead', dynamic=False)
+    
     # Count parameters
     total_params = sum(p.numel() for p in model.parameters())
     print(f"✓ Model created: {total_params:,} parameters")
@@ -78,64 +115,73 @@ def train_pathfinding_bdh(
     optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate, weight_decay=0.01)
     criterion = nn.CrossEntropyLoss()
     
+    # Mixed precision on CUDA: bf16 autocast needs no loss scaling, fp16
+    # uses a GradScaler. Weights and AdamW state stay in fp32.
+    device_type = torch.device(device).type
+    amp_dtype = {'bf16': torch.bfloat16, 'fp16': torch.float16}.get(precision)
+    use_amp = amp_dtype is not None and device_type == 'cuda'
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp and amp_dtype == torch.float16)
+    
     # Training loop
     print("\n🚀 Starting training...")
     print("=" * 70)
     
+    # Per-epoch TensorBoard scalars survive an interrupted run; tensorboard
+    # itself is optional
+    writer = None
+    if log_dir is not None:
+        try:
+            from torch.utils.tensorboard import SummaryWriter
+            writer = SummaryWriter(log_dir)
+        except ImportError:
+            print("⚠️  tensorboard not installed; training curves are not logged")
+    
     losses = []
     best_loss = float('inf')
     start_time = time.time()
     
     for epoch in range(num_epochs):
         model.train()
-        epoch_loss = 0
-        correct = 0
+        # Loss and hit counters stay on the device; reading them back every
+        # batch would force a sync per step
+        epoch_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.long, device=device)
         total = 0
         
+        optimizer.zero_grad(set_to_none=True)
+        num_batches = len(loader)
         for batch_idx, (boards, targets) in enumerate(loader):
-            boards, targets = boards.to(device), targets.to(device)
-            
-            optimizer.zero_grad()
+            boards = boards.to(device, non_blocking=True)
+            targets = targets.to(device, non_blocking=True)
             
             # Forward pass
-            logits = model(boards, capture_frames=False)
-            
-            # We want to predict the next cell, so we take the last token's logits
-            # and map them to cell indices (0-99 for 10x10 board)
-            # For simplicity, we'll use a linear layer to map to 100 classes
-            # But BDH outputs vocab_size (5), so we need to reshape
-            
-            # Actually, let's use the logits at the last position
-            # and interpret them as probabilities over next positions
-            # We'll need to add a projection layer
+            with torch.autocast(device_type, dtype=amp_dtype, enabled=use_amp):
+                logits = forward(boards, capture_frames=False)
+                
+                # BDH outputs vocab_size (5) logits, not the 0-99 target cells,
+                # so without a projection head train on vocabulary prediction
+                # and use the board state as both input and target
+                loss = criterion(logits.view(-1, params.V), boards.view(-1))
             
-            # For now, let's use cross-entropy on the full sequence
-            # Target is the next cell index
-            loss = criterion(logits[:, -1, :], targets)  # Use last position
+            # Gradients of accum_steps batches add up before each optimizer
+            # step, for an effective batch of batch_size * accum_steps. The
+            # last group of an epoch may be shorter, so each loss is divided
+            # by the size of its own group to keep the update's scale
+            group_start = batch_idx - batch_idx % accum_steps
+            group_size = min(accum_steps, num_batches - group_start)
+            scaler.scale(loss / group_size).backward()
+            if (batch_idx + 1) % accum_steps == 0 or batch_idx + 1 == num_batches:
+                scaler.unscale_(optimizer)
+                torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad(set_to_none=True)
             
-            # Wait, this won't work because logits are vocab_size (5)
-            # but targets are cell indices (0-99)
-            
-            # Let's rethink: we need to add a projection head
-            # For now, let's just train on vocabulary prediction
-            # and use the board state as both input and target
-            
-            # Actually, let's use a simpler approach:
-            # Predict which direction to move (up, down, left, right, stay)
-            # This maps to vocab 0-4
-            
-            # For this iteration, let's just measure loss on reconstruction
-            loss = criterion(logits.view(-1, params.V), boards.view(-1))
-            
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
-            optimizer.step()
-            
-            epoch_loss += loss.item()
+            epoch_loss += loss.detach()
             
             # Calculate accuracy
             preds = logits.argmax(dim=-1)
-            correct += (preds == boards).sum().item()
+            correct += (preds == boards).sum()
             total += boards.numel()
             
             if batch_idx % 100 == 0:
@@ -143,12 +189,12 @@ def train_pathfinding_bdh(
                 print(f"Epoch {epoch+1:3d}/{num_epochs} | "
                       f"Batch {batch_idx:4d}/{len(loader)} | "
                       f"Loss: {loss.item():.4f} | "
-                      f"Acc: {100*correct/total:.1f}% | "
+                      f"Acc: {100*correct.item()/total:.1f}% | "
                       f"Time: {elapsed/60:.1f}m")
         
         # Epoch summary
-        avg_loss = epoch_loss / len(loader)
-        accuracy = 100 * correct / total
+        avg_loss = epoch_loss.item() / len(loader)
+        accuracy = 100 * correct.item() / total
         losses.append(avg_loss)
         
         elapsed = time.time() - start_time
@@ -159,6 +205,11 @@ def train_pathfinding_bdh(
               f"Time: {elapsed/60:.1f}m")
         print(f"{'='*70}\n")
         
+        if writer is not None:
+            writer.add_scalar('loss/train', avg_loss, epoch)
+            writer.add_scalar('acc/train', accuracy, epoch)
+            writer.flush()
+        
         # Save best model
         if avg_loss < best_loss:
             best_loss = avg_loss
@@ -179,27 +230,56 @@ def train_pathfinding_bdh(
     print(f"Checkpoint saved: {checkpoint_path}")
     print("=" * 70)
     
+    if writer is not None:
+        writer.close()
+    
     # Plot training curve
-    plt.figure(figsize=(10, 6))
-    plt.plot(losses, linewidth=2, color='#6366f1')
-    plt.xlabel('Epoch', fontsize=12)
-    plt.ylabel('Loss', fontsize=12)
-    plt.title('BDH Pathfinding Training Loss', fontsize=14, fontweight='bold')
-    plt.grid(True, alpha=0.3)
-    plt.tight_layout()
-    plt.savefig('../../docs/pathfinding_training_loss.png', dpi=150)
-    print(f"\n✓ Training curve saved: docs/pathfinding_training_loss.png")
+    if plot:
+        # Imported here so importing the trainer (and every DataLoader worker it
+        # forks) skips matplotlib; Agg renders to file without a GUI backend
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        plt.figure(figsize=(10, 6))
+        plt.plot(losses, linewidth=2, color='#6366f1')
+        plt.xlabel('Epoch', fontsize=12)
+        plt.ylabel('Loss', fontsize=12)
+        plt.title('BDH Pathfinding Training Loss', fontsize=14, fontweight='bold')
+        plt.grid(True, alpha=0.3)
+        plt.tight_layout()
+        plt.savefig('../../docs/pathfinding_training_loss.png', dpi=150)
+        print(f"\n✓ Training curve saved: docs/pathfinding_training_loss.png")
     
     return model, losses
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train BDH on the pathfinding task")
+    parser.add_argument('--precision', choices=['fp32', 'bf16', 'fp16'], default='bf16',
+                        help="Autocast precision on CUDA (ignored on CPU)")
+    parser.add_argument('--dataset-seed', type=int, default=None,
+                        help="Seed the dataset; seeded datasets are cached under ../../cache")
+    parser.add_argument('--regenerate-dataset', action='store_true',
+                        help="Regenerate the dataset even if it is cached")
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help="Batch size per forward/backward pass")
+    parser.add_argument('--accum', type=int, default=1,
+                        help="Batches of gradients to accumulate per optimizer step")
+    parser.add_argument('--plot', action='store_true',
+                        help="Also save a matplotlib plot of the training loss")
+    args = parser.parse_args()
+    
     # Train the model
     model, losses = train_pathfinding_bdh(
         num_samples=50000,
         num_epochs=100,
-        batch_size=32,
-        learning_rate=3e-4
+        batch_size=args.batch_size,
+        learning_rate=3e-4,
+        precision=args.precision,
+        dataset_seed=args.dataset_seed,
+        regenerate_dataset=args.regenerate_dataset,
+        plot=args.plot,
+        accum_steps=args.accum
     )
     
     print("\n🎉 Training complete! Model ready for deployment.")
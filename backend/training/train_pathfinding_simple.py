@@ -5,6 +5,7 @@ Clean approach: Set V=100 (num_cells) so BDH directly predicts next cell.
 No projection head needed!
 """
 
+import argparse
 import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../reference-bdh'))
@@ -13,7 +14,7 @@ import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader
 import time
-import matplotlib.pyplot as plt
+from typing import Optional
 from pathfinding_dataset import PathfindingDataset
 from bdh import BDH, BDHParameters
 
@@ -24,7 +25,14 @@ def train_bdh_pathfinding(
     batch_size: int = 32,
     learning_rate: float = 3e-4,
     device: str = 'cuda' if torch.cuda.is_available() else 'cpu',
-    checkpoint_dir: str = '../../checkpoints'
+    checkpoint_dir: str = '../../checkpoints',
+    precision: str = 'bf16',
+    dataset_seed: Optional[int] = None,
+    dataset_cache_dir: str = '../../cache',
+    regenerate_dataset: bool = False,
+    log_dir: Optional[str] = '../../runs/pathfinding_simple',
+    plot: bool = False,
+    accum_steps: int = 1
 ):
     """
     Train BDH on pathfinding - SIMPLE VERSION
@@ -38,13 +46,29 @@ def train_bdh_pathfinding(
     print(f"Device: {device}")
     print(f"Samples: {num_samples}")
     print(f"Epochs: {num_epochs}")
-    print(f"Batch size: {batch_size}")
+    print(f"Batch size: {batch_size} x {accum_steps} accumulation steps")
     print("=" * 70)
     
     # Create dataset
     print("\n📦 Creating dataset...")
-    dataset = PathfindingDataset(num_samples=num_samples, board_size=10)
-    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=0)
+    dataset = PathfindingDataset(
+        num_samples=num_samples,
+        board_size=10,
+        seed=dataset_seed,
+        cache_dir=dataset_cache_dir,
+        force_regenerate=regenerate_dataset
+    )
+    # Persistent workers keep their processes across epochs; pinned batches
+    # let the host-to-device copies below run asynchronously
+    loader = DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=min(8, os.cpu_count() or 1),
+        persistent_workers=True,
+        pin_memory=torch.device(device).type == 'cuda',
+        prefetch_factor=4
+    )
     print(f"✓ Dataset: {len(dataset)} samples, {len(loader)} batches/epoch")
     
     # Create BDH model with V=100 (one class per cell)
@@ -64,6 +88,13 @@ def train_bdh_pathfinding(
     model = BDH(params)
     model.to(device)
     
+    # Fixed T and V let Inductor specialize every kernel statically, and this
+    # run is long enough for max-autotune's kernel search to pay off. The
+    # uncompiled module keeps plain state_dict keys for checkpoints.
+    forward = model
+    if hasattr(torch, 'compile'):
+        forward = torch.compile(model, mode='max-autotune', dynamic=False)
+    
     total_params = sum(p.numel() for p in model.parameters())
     print(f"✓ Model created: {total_params:,} parameters")
     print(f"✓ Vocabulary size: {params.V} (maps to {10}x{10} board)")
@@ -72,10 +103,27 @@ def train_bdh_pathfinding(
     optimizer = torch.optim.AdamW(model.parameters(), lr=learning_rate, weight_decay=0.01)
     criterion = nn.CrossEntropyLoss()
     
+    # Mixed precision on CUDA: bf16 autocast needs no loss scaling, fp16
+    # uses a GradScaler. Weights and AdamW state stay in fp32.
+    device_type = torch.device(device).type
+    amp_dtype = {'bf16': torch.bfloat16, 'fp16': torch.float16}.get(precision)
+    use_amp = amp_dtype is not None and device_type == 'cuda'
+    scaler = torch.cuda.amp.GradScaler(enabled=use_amp and amp_dtype == torch.float16)
+    
     # Training loop
     print("\n🚀 Starting training...")
     print("=" * 70)
     
+    # Per-epoch TensorBoard scalars survive an interrupted run; tensorboard
+    # itself is optional
+    writer = None
+    if log_dir is not None:
+        try:
+            from torch.utils.tensorboard import SummaryWriter
+            writer = SummaryWriter(log_dir)
+        except ImportError:
+            print("⚠️  tensorboard not installed; training curves are not logged")
+    
     losses = []
     accuracies = []
     best_loss = float('inf')
@@ -84,14 +132,17 @@ def train_bdh_pathfinding(
     
     for epoch in range(num_epochs):
         model.train()
-        epoch_loss = 0
-        correct = 0
+        # Loss and hit counters stay on the device; reading them back every
+        # batch would force a sync per step
+        epoch_loss = torch.zeros((), device=device)
+        correct = torch.zeros((), dtype=torch.long, device=device)
         total = 0
         
+        optimizer.zero_grad(set_to_none=True)
+        num_batches = len(loader)
         for batch_idx, (boards, targets) in enumerate(loader):
-            boards, targets = boards.to(device), targets.to(device)
-            
-            optimizer.zero_grad()
+            boards = boards.to(device, non_blocking=True)
+            targets = targets.to(device, non_blocking=True)
             
             # Forward pass
             # boards: [B, 100] with values 0-4 (board state)
@@ -103,28 +154,39 @@ def train_bdh_pathfinding(
             # The output logits will be [B, T, V=100]
             # We want to predict the target cell (0-99)
             
-            logits = model(boards, capture_frames=False)  # [B, T=100, V=100]
-            
-            # Use last position to predict next cell
-            last_logits = logits[:, -1, :]  # [B, V=100]
+            with torch.autocast(device_type, dtype=amp_dtype, enabled=use_amp):
+                logits = forward(boards, capture_frames=False)  # [B, T=100, V=100]
+                
+                # Use last position to predict next cell
+                last_logits = logits[:, -1, :]  # [B, V=100]
+                
+                # Compute loss
+                loss = criterion(last_logits, targets)
             
-            # Compute loss
-            loss = criterion(last_logits, targets)
+            # Gradients of accum_steps batches add up before each optimizer
+            # step, for an effective batch of batch_size * accum_steps. The
+            # last group of an epoch may be shorter, so each loss is divided
+            # by the size of its own group to keep the update's scale
+            group_start = batch_idx - batch_idx % accum_steps
+            group_size = min(accum_steps, num_batches - group_start)
+            scaler.scale(loss / group_size).backward()
+            if (batch_idx + 1) % accum_steps == 0 or batch_idx + 1 == num_batches:
+                scaler.unscale_(optimizer)
+                torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+                scaler.step(optimizer)
+                scaler.update()
+                optimizer.zero_grad(set_to_none=True)
             
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
-            optimizer.step()
-            
-            epoch_loss += loss.item()
+            epoch_loss += loss.detach()
             
             # Calculate accuracy
             preds = last_logits.argmax(dim=-1)
-            correct += (preds == targets).sum().item()
+            correct += (preds == targets).sum()
             total += targets.size(0)
             
             if batch_idx % 50 == 0:
                 elapsed = time.time() - start_time
-                acc = 100 * correct / total if total > 0 else 0
+                acc = 100 * correct.item() / total if total > 0 else 0
                 print(f"Epoch {epoch+1:3d}/{num_epochs} | "
                       f"Batch {batch_idx:4d}/{len(loader)} | "
                       f"Loss: {loss.item():.4f} | "
@@ -132,8 +194,8 @@ def train_bdh_pathfinding(
                       f"Time: {elapsed/60:.1f}m")
         
         # Epoch summary
-        avg_loss = epoch_loss / len(loader)
-        accuracy = 100 * correct / total
+        avg_loss = epoch_loss.item() / len(loader)
+        accuracy = 100 * correct.item() / total
         losses.append(avg_loss)
         accuracies.append(accuracy)
         
@@ -145,6 +207,11 @@ def train_bdh_pathfinding(
               f"Time: {elapsed/60:.1f}m")
         print(f"{'='*70}\n")
         
+        if writer is not None:
+            writer.add_scalar('loss/train', avg_loss, epoch)
+            writer.add_scalar('acc/train', accuracy, epoch)
+            writer.flush()
+        
         # Save best model
         if accuracy > best_acc:
             best_acc = accuracy
@@ -167,26 +234,33 @@ def train_bdh_pathfinding(
     print(f"Checkpoint: {checkpoint_path}")
     print("=" * 70)
     
+    if writer is not None:
+        writer.close()
+    
     # Plot training curves
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
-    
-    ax1.plot(losses, linewidth=2, color='#6366f1')
-    ax1.set_xlabel('Epoch', fontsize=12)
-    ax1.set_ylabel('Loss', fontsize=12)
-    ax1.set_title('Training Loss', fontsize=14, fontweight='bold')
-    ax1.grid(True, alpha=0.3)
-    
-    ax2.plot(accuracies, linewidth=2, color='#10b981')
-    ax2.set_xlabel('Epoch', fontsize=12)
-    ax2.set_ylabel('Accuracy (%)', fontsize=12)
-    ax2.set_title('Training Accuracy', fontsize=14, fontweight='bold')
-    ax2.grid(True, alpha=0.3)
-    
-    plt.tight_layout()
-    plot_path = '../../docs/pathfinding_training.png'
-    os.makedirs(os.path.dirname(plot_path), exist_ok=True)
-    plt.savefig(plot_path, dpi=150)
-    print(f"\n✓ Training curves saved: {plot_path}")
+    if plot:
+        import matplotlib
+        matplotlib.use('Agg')  # File output only, no GUI backend
+        import matplotlib.pyplot as plt
+        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
+        
+        ax1.plot(losses, linewidth=2, color='#6366f1')
+        ax1.set_xlabel('Epoch', fontsize=12)
+        ax1.set_ylabel('Loss', fontsize=12)
+        ax1.set_title('Training Loss', fontsize=14, fontweight='bold')
+        ax1.grid(True, alpha=0.3)
+        
+        ax2.plot(accuracies, linewidth=2, color='#10b981')
+        ax2.set_xlabel('Epoch', fontsize=12)
+        ax2.set_ylabel('Accuracy (%)', fontsize=12)
+        ax2.set_title('Training Accuracy', fontsize=14, fontweight='bold')
+        ax2.grid(True, alpha=0.3)
+        
+        plt.tight_layout()
+        plot_path = '../../docs/pathfinding_training.png'
+        os.makedirs(os.path.dirname(plot_path), exist_ok=True)
+        plt.savefig(plot_path, dpi=150)
+        print(f"\n✓ Training curves saved: {plot_path}")
     
     return model, losses, accuracies
 
@@ -195,12 +269,32 @@ if __name__ == "__main__":
     print("\n🚀 Starting BDH Pathfinding Training...")
     print("This will train BDH to predict the next cell in an optimal path.\n")
     
+    parser = argparse.ArgumentParser(description="Train BDH (V=100) to predict the next cell")
+    parser.add_argument('--precision', choices=['fp32', 'bf16', 'fp16'], default='bf16',
+                        help="Autocast precision on CUDA (ignored on CPU)")
+    parser.add_argument('--dataset-seed', type=int, default=None,
+                        help="Seed the dataset; seeded datasets are cached under ../../cache")
+    parser.add_argument('--regenerate-dataset', action='store_true',
+                        help="Regenerate the dataset even if it is cached")
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help="Batch size per forward/backward pass")
+    parser.add_argument('--accum', type=int, default=1,
+                        help="Batches of gradients to accumulate per optimizer step")
+    parser.add_argument('--plot', action='store_true',
+                        help="Also save a matplotlib plot of the training curves")
+    args = parser.parse_args()
+    
     # Train with small dataset first to test
     model, losses, accs = train_bdh_pathfinding(
         num_samples=10000,   # Start small
         num_epochs=50,
-        batch_size=32,
-        learning_rate=3e-4
+        batch_size=args.batch_size,
+        learning_rate=3e-4,
+        precision=args.precision,
+        dataset_seed=args.dataset_seed,
+        regenerate_dataset=args.regenerate_dataset,
+        plot=args.plot,
+        accum_steps=args.accum
     )
     
     print("\n🎉 Training complete!")
@@ -0,0 +1,71 @@
+"""
+Activation Sparsity Reductions
+
+Non-zero counts per layer, per token and per neuron, plus per-neuron sums,
+of an activation stack [L, T, N] in a single pass. With Numba the pass is
+compiled and parallel across layers; without it the same reductions run as
+NumPy array operations (a pure-Python loop over L * T * N would be far
+slower than NumPy).
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def activation_stats(y):
+        """
+        Single-pass sparsity reductions over an activation stack.
+
+        Args:
+            y: Activations [L, T, N] (C-contiguous)
+
+        Returns:
+            (layer_active [L], token_active [T], neuron_active [N],
+            neuron_sum [N]): non-zero counts per layer, per token and per
+            neuron (summed over the other axes), and per-neuron sums
+        """
+        L, T, N = y.shape
+
+        # One row of partial results per layer, so the parallel layers never
+        # write the same slot; rows are summed at the end
+        layer_active = np.zeros(L, np.int64)
+        token_active = np.zeros((L, T), np.int64)
+        neuron_active = np.zeros((L, N), np.int64)
+        neuron_sum = np.zeros((L, N), np.float64)
+
+        for l in prange(L):
+            layer_count = 0
+            for t in range(T):
+                token_count = 0
+                for n in range(N):
+                    value = y[l, t, n]
+                    if value != 0:
+                        token_count += 1
+                        neuron_active[l, n] += 1
+                    neuron_sum[l, n] += value
+                token_active[l, t] = token_count
+                layer_count += token_count
+            layer_active[l] = layer_count
+
+        return (
+            layer_active,
+            token_active.sum(axis=0),
+            neuron_active.sum(axis=0),
+            neuron_sum.sum(axis=0),
+        )
+else:
+    def activation_stats(y):
+        """NumPy fallback for activation_stats (see the Numba version)"""
+        token_active_per_layer = np.count_nonzero(y, axis=2)  # [L, T]
+        return (
+            token_active_per_layer.sum(axis=1),
+            token_active_per_layer.sum(axis=0),
+            np.count_nonzero(y, axis=(0, 1)),
+            y.sum(axis=(0, 1), dtype=np.float64),
+        )
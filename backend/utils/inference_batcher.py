@@ -0,0 +1,291 @@
+"""
+Dynamic Request Batching for BDH Inference
+
+This module collects concurrent single-sample inference requests and runs
+them through the model as one padded batch, so the weights are read once
+per batch instead of once per request. It also provides TracedForward, a
+shape-specialized torch.jit.trace wrapper for the untracked forward pass.
+"""
+
+import asyncio
+import contextlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+from torch.nn.utils.rnn import pad_sequence
+
+
+class _UntrackedForward(torch.nn.Module):
+    """Module wrapper so the untracked forward can be traced with its parameters"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_):
+        return self.model(input_, capture_frames=False)
+
+
+class TracedForward:
+    """
+    Untracked BDH forward pass specialized with torch.jit.trace.
+
+    A trace is recorded the first time each input shape [B, T] is seen and
+    reused afterwards, so repeated requests replay one graph instead of
+    iterating the layers in Python. At most `max_traces` shapes are kept;
+    other shapes, tracked passes and models that fail to trace use the eager
+    model.
+    """
+
+    def __init__(self, model, max_traces: int = 8):
+        self.model = model
+        self.max_traces = max_traces
+        self._module = _UntrackedForward(model).eval()
+        self._traces: Dict[Tuple[int, ...], torch.jit.ScriptModule] = {}
+        self._failed = False
+
+    def __call__(self, input_: torch.Tensor, capture_frames: bool = False):
+        if capture_frames or self._failed:
+            return self.model(input_, capture_frames=capture_frames)
+
+        shape = tuple(input_.shape)
+        traced = self._traces.get(shape)
+        if traced is None:
+            if len(self._traces) >= self.max_traces:
+                return self.model(input_, capture_frames=False)
+            try:
+                # Trace outside inference_mode so the graph keeps normal parameter tensors
+                with torch.inference_mode(False), torch.no_grad():
+                    traced = torch.jit.trace(self._module, input_, strict=False, check_trace=False)
+            except Exception as e:
+                print(f"⚠ torch.jit.trace failed, using eager forward: {e}")
+                self._failed = True
+                return self.model(input_, capture_frames=False)
+            self._traces[shape] = traced
+
+        return traced(input_)
+
+
+class InferenceBatcher:
+    """
+    Micro-batching queue in front of a BDH model.
+
+    Requests are collected until `max_batch_size` is reached or
+    `max_latency_ms` has passed since the first queued request, then run as a
+    single forward pass. Inputs are right-padded to a common length; BDH
+    attention is causal, so padding does not change the logits of the real
+    positions.
+
+    With `capture_frames=True` the batcher runs tracked forward passes
+    instead. The instrumented model keeps its captured states on the model
+    itself, so tracked requests are executed one at a time and return
+    `(logits, states)`.
+
+    Forward passes run in a worker thread so the event loop stays free while
+    the model computes. Batchers sharing a model should share `lock`, since
+    tracking toggles state on the model.
+
+    If `autocast_dtype` is set (e.g. torch.float16 on CUDA), forward passes
+    run under torch.autocast with that dtype. With `release_cache=True`,
+    cached CUDA blocks are returned to the driver after each tracked pass,
+    since the captured frames of every layer can pin hundreds of MB.
+
+    On CUDA, passing `max_seq_len` allocates a pinned host staging buffer and
+    a matching device buffer of shape [max_batch_size, max_seq_len]; batches
+    are assembled in the staging buffer and copied into the device buffer
+    with non_blocking=True. The worker runs one batch at a time, so the
+    buffers of a batcher are never shared between batches.
+
+    If `stream` is given, each batch (including its host-to-device copy) is
+    issued on that CUDA stream and the stream is synchronized before results
+    are handed back. Giving each batcher its own stream lets one batcher's
+    input copy overlap with another batcher's forward pass.
+
+    With `static_shapes=True`, batches are padded to a power-of-two batch size
+    and, when it fits, to `max_seq_len`, so a compiled model only ever sees a
+    handful of shapes and can reuse its graphs instead of recompiling.
+    """
+
+    def __init__(
+        self,
+        model,
+        device: torch.device,
+        max_batch_size: int = 16,
+        max_latency_ms: float = 5.0,
+        capture_frames: bool = False,
+        lock: Optional[threading.Lock] = None,
+        autocast_dtype: Optional[torch.dtype] = None,
+        release_cache: bool = False,
+        max_seq_len: Optional[int] = None,
+        stream: Optional["torch.cuda.Stream"] = None,
+        static_shapes: bool = False
+    ):
+        self.model = model
+        self.device = device
+        self.capture_frames = capture_frames
+        self.lock = lock if lock is not None else threading.Lock()
+        self.autocast_dtype = autocast_dtype
+        self.release_cache = release_cache
+        self.stream = stream
+        self.static_shapes = static_shapes
+        self.max_seq_len = max_seq_len
+        self.max_batch_size = 1 if capture_frames else max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+
+        # Pinned host staging buffer and its device twin for asynchronous host-to-device copies
+        self._staging: Optional[torch.Tensor] = None
+        self._device_buf: Optional[torch.Tensor] = None
+        if device.type == 'cuda' and max_seq_len is not None:
+            self._staging = torch.zeros(
+                (self.max_batch_size, max_seq_len), dtype=torch.long
+            ).pin_memory()
+            self._device_buf = torch.empty_like(self._staging, device=device)
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._worker_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background worker (must be called from a running loop)"""
+        self.queue = asyncio.Queue()
+        self._worker_task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        """Cancel the background worker"""
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+            self._worker_task = None
+
+    async def submit(self, tokens: torch.Tensor):
+        """
+        Queue a single input sequence and wait for its result.
+
+        Args:
+            tokens: Input token IDs [T] (CPU, long)
+
+        Returns:
+            logits [T, V], or (logits [T, V], states) when capturing frames
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((tokens, future))
+        return await future
+
+    def _autocast(self):
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(self.device.type, dtype=self.autocast_dtype)
+
+    async def _collect(self) -> List[Tuple[torch.Tensor, asyncio.Future]]:
+        """Wait for one request, then drain more until the batch is full or the deadline passes"""
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        deadline = loop.time() + self.max_latency
+
+        while len(items) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return items
+
+    def _padded_shape(self, token_list: List[torch.Tensor]) -> Tuple[int, int]:
+        """Batch shape [B, T] to pad the token sequences to"""
+        B = len(token_list)
+        T = max(tokens.numel() for tokens in token_list)
+
+        if self.static_shapes:
+            # Next power of two, capped at the largest batch this batcher forms
+            B = min(1 << (B - 1).bit_length(), self.max_batch_size)
+            if self.max_seq_len is not None and T <= self.max_seq_len:
+                T = self.max_seq_len
+
+        return B, T
+
+    def _to_device(self, token_list: List[torch.Tensor]) -> torch.Tensor:
+        """Right-pad token sequences into a [B, T] batch on the device"""
+        B, T = self._padded_shape(token_list)
+
+        if self._staging is None or T > self._staging.shape[1]:
+            batch = pad_sequence(token_list, batch_first=True, padding_value=0)
+            batch = F.pad(batch, (0, T - batch.shape[1], 0, B - batch.shape[0]))
+            return batch.to(self.device)
+
+        staging = self._staging[:B, :T]
+        staging.zero_()
+        for i, tokens in enumerate(token_list):
+            staging[i, :tokens.numel()].copy_(tokens)
+
+        # The copy is complete before the next batch reuses the buffers, since
+        # results are synchronously moved back to the host after the forward
+        batch = self._device_buf[:B, :T]
+        batch.copy_(staging, non_blocking=True)
+        return batch
+
+    def _run_batch(self, token_list: List[torch.Tensor]) -> list:
+        """Run one fused forward pass and split the output per request"""
+        lengths = [tokens.numel() for tokens in token_list]
+        batch = self._to_device(token_list)
+
+        with self.lock, torch.inference_mode(), self._autocast():
+            logits = self.model(batch, capture_frames=False).float().cpu()
+
+        return [logits[i, :n] for i, n in enumerate(lengths)]
+
+    def _run_tracked(self, tokens: torch.Tensor):
+        """Run a single forward pass with state tracking"""
+        with self.lock:
+            self.model.enable_tracking()
+            try:
+                with torch.inference_mode(), self._autocast():
+                    logits, *frames = self.model(self._to_device([tokens]), capture_frames=True)
+            finally:
+                self.model.disable_tracking()
+
+            logits = logits[0].float().cpu()
+
+            # States were copied to host memory; drop the device-side frames
+            del frames
+            if self.release_cache and self.device.type == 'cuda':
+                torch.cuda.empty_cache()
+
+            return logits, self.model.get_states()
+
+    def _run(self, token_list: List[torch.Tensor]) -> list:
+        if self.stream is None:
+            return self._run_unsynced(token_list)
+
+        with torch.cuda.stream(self.stream):
+            results = self._run_unsynced(token_list)
+        self.stream.synchronize()
+        return results
+
+    def _run_unsynced(self, token_list: List[torch.Tensor]) -> list:
+        if self.capture_frames:
+            return [self._run_tracked(tokens) for tokens in token_list]
+        return self._run_batch(token_list)
+
+    async def _worker(self):
+        while True:
+            items = await self._collect()
+            futures = [future for _, future in items]
+
+            try:
+                results = await asyncio.to_thread(self._run, [tokens for tokens, _ in items])
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
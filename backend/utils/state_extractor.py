@@ -5,20 +5,79 @@ This module provides utilities to extract and process BDH internal states
 for visualization purposes.
 """
 
+import base64
 import numpy as np
 import networkx as nx
-from typing import Dict, List, Tuple, Optional
-from collections import defaultdict
+from typing import Dict, List, Tuple, Optional, Union
+from _sparsity_nb import activation_stats
+
+
+# Graphs with at least this many nodes use Louvain community detection;
+# greedy (Clauset-Newman-Moore) merging is only affordable below it
+LOUVAIN_MIN_NODES = 100
 
 
 class StateExtractor:
     """Extract and process BDH internal states for visualization"""
     
+    @staticmethod
+    def _stack_layers(arrays: Union[List[np.ndarray], np.ndarray]) -> np.ndarray:
+        """
+        Per-layer arrays as one float32 [L, ...] array. An array that is
+        already stacked (as BDHInstrumented stores its states) is used
+        without a copy.
+        """
+        if isinstance(arrays, np.ndarray):
+            return arrays.astype(np.float32, copy=False)
+        return np.stack(arrays, axis=0, dtype=np.float32)
+    
+    @staticmethod
+    def encode_float16(arr: np.ndarray) -> Dict:
+        """
+        Encode a dense array compactly for JSON as float16 bytes.
+        
+        Args:
+            arr: Dense array of any rank
+        
+        Returns:
+            Dictionary with 'shape', 'dtype' ('float16') and 'data' (base64 of
+            the raw little-endian bytes); decode with
+            np.frombuffer(base64.b64decode(data), '<f2').reshape(shape)
+        """
+        arr = np.asarray(arr)
+        return {
+            'shape': list(arr.shape),
+            'dtype': 'float16',
+            'data': base64.b64encode(arr.astype('<f2').tobytes()).decode('ascii'),
+        }
+    
+    @staticmethod
+    def sparsify_array(arr: np.ndarray, threshold: float = 0.0) -> Dict:
+        """
+        Convert an array to COO form, keeping entries with |value| > threshold.
+        
+        Args:
+            arr: Dense array of any rank
+            threshold: Magnitude threshold (0 keeps every non-zero entry)
+        
+        Returns:
+            Dictionary with 'shape', 'indices' [ndim, nnz] (int32) and
+            'values' [nnz] (float16)
+        """
+        arr = np.asarray(arr)
+        coords = np.nonzero(np.abs(arr) > threshold)
+        return {
+            'shape': list(arr.shape),
+            'indices': np.stack(coords, axis=0).astype(np.int32),
+            'values': arr[coords].astype(np.float16),
+        }
+    
     @staticmethod
     def extract_graph_topology(
         Gx: np.ndarray,
         threshold: float = 0.1,
-        top_k_nodes: Optional[int] = None
+        top_k_nodes: Optional[int] = None,
+        compute_modularity: bool = True
     ) -> Dict:
         """
         Extract graph topology from Gx matrix.
@@ -27,95 +86,110 @@ class StateExtractor:
             Gx: Causal circuit matrix [N, N]
             threshold: Edge weight threshold
             top_k_nodes: If set, only keep top-k nodes by degree
+            compute_modularity: Run community detection; when False (it is
+                the most expensive step), 'modularity' is None and
+                'num_communities' is 0
         
         Returns:
-            Dictionary with nodes, edges, and topology metrics
+            Dictionary with nodes, edges, and topology metrics. Edges are in
+            COO form: {'row': [...], 'col': [...], 'weight': [...]}
         """
         N = Gx.shape[0]
         
-        # Build NetworkX graph
-        G = nx.DiGraph()
-        
-        # Add all nodes
-        for i in range(N):
-            G.add_node(i)
-        
-        # Add edges above threshold
-        edges = []
-        edge_weights = []
-        for i in range(N):
-            for j in range(N):
-                weight = Gx[i, j]
-                if abs(weight) > threshold:
-                    G.add_edge(i, j, weight=float(weight))
-                    edges.append({
-                        'source': int(i),
-                        'target': int(j),
-                        'weight': float(weight)
-                    })
-                    edge_weights.append(abs(weight))
-        
-        # Compute degree distribution
-        in_degrees = dict(G.in_degree())
-        out_degrees = dict(G.out_degree())
-        total_degrees = {i: in_degrees[i] + out_degrees[i] for i in range(N)}
-        
-        degree_list = list(total_degrees.values())
+        # Reduce in float32
+        Gx = np.asarray(Gx, dtype=np.float32)
+        
+        # Edges above threshold as parallel COO lists, found with one mask
+        # over Gx rather than a Python loop over all N^2 entries
+        edge_mask = np.abs(Gx) > threshold
+        edge_rows_arr, edge_cols_arr = np.nonzero(edge_mask)
+        edge_weights_arr = Gx[edge_rows_arr, edge_cols_arr].astype(np.float64)
+        
+        # Compute degree distribution (a self-loop counts as in- and out-edge)
+        in_degrees = edge_mask.sum(axis=0)
+        out_degrees = edge_mask.sum(axis=1)
+        total_degrees = in_degrees + out_degrees
         
         # Identify hub neurons (top 10% by degree)
-        if len(degree_list) > 0:
-            hub_threshold = np.percentile(degree_list, 90)
-            hubs = [i for i, deg in total_degrees.items() if deg >= hub_threshold]
+        if N > 0:
+            hub_threshold = np.percentile(total_degrees, 90)
+            is_hub = total_degrees >= hub_threshold
+            hubs = np.flatnonzero(is_hub).tolist()
         else:
             hub_threshold = 0
+            is_hub = np.zeros(0, dtype=bool)
             hubs = []
         
         # If top_k_nodes specified, filter to top-k by degree
         if top_k_nodes is not None and top_k_nodes < N:
-            # Get top-k nodes by total degree
-            top_nodes = sorted(total_degrees.items(), key=lambda x: x[1], reverse=True)[:top_k_nodes]
-            top_node_ids = set([node_id for node_id, _ in top_nodes])
+            # Top-k nodes by total degree (ties go to the lower id), in id
+            # order. Folding the id into the key makes every key distinct,
+            # so a linear-time argpartition picks the same nodes a stable
+            # sort would.
+            rank_key = total_degrees.astype(np.int64) * N + (N - 1 - np.arange(N))
+            if top_k_nodes > 0:
+                node_ids = np.sort(np.argpartition(rank_key, -top_k_nodes)[-top_k_nodes:])
+            else:
+                node_ids = np.zeros(0, dtype=np.intp)
             
             # Filter edges to only include top nodes
-            filtered_edges = [
-                e for e in edges 
-                if e['source'] in top_node_ids and e['target'] in top_node_ids
-            ]
-            edges = filtered_edges
-            
-            # Update nodes list
-            nodes = [
-                {
-                    'id': int(node_id),
-                    'degree': int(total_degrees[node_id]),
-                    'in_degree': int(in_degrees[node_id]),
-                    'out_degree': int(out_degrees[node_id]),
-                    'is_hub': node_id in hubs
-                }
-                for node_id in top_node_ids
-            ]
-            
-            # Update degree_list to only include filtered nodes
-            degree_list = [total_degrees[node_id] for node_id in top_node_ids]
+            in_top = np.zeros(N, dtype=bool)
+            in_top[node_ids] = True
+            keep = in_top[edge_rows_arr] & in_top[edge_cols_arr]
+            edge_rows = edge_rows_arr[keep].tolist()
+            edge_cols = edge_cols_arr[keep].tolist()
+            edge_weights = edge_weights_arr[keep].tolist()
         else:
-            nodes = [
-                {
-                    'id': int(i),
-                    'degree': int(total_degrees[i]),
-                    'in_degree': int(in_degrees[i]),
-                    'out_degree': int(out_degrees[i]),
-                    'is_hub': i in hubs
-                }
-                for i in range(N)
-            ]
-        
-        # Compute modularity (if graph is not empty)
+            node_ids = np.arange(N)
+            edge_rows = edge_rows_arr.tolist()
+            edge_cols = edge_cols_arr.tolist()
+            edge_weights = edge_weights_arr.tolist()
+        
+        degree_list = total_degrees[node_ids].tolist()
+        nodes = [
+            {
+                'id': node_id,
+                'degree': degree,
+                'in_degree': in_degree,
+                'out_degree': out_degree,
+                'is_hub': hub
+            }
+            for node_id, degree, in_degree, out_degree, hub in zip(
+                node_ids.tolist(),
+                degree_list,
+                in_degrees[node_ids].tolist(),
+                out_degrees[node_ids].tolist(),
+                is_hub[node_ids].tolist()
+            )
+        ]
+        
+        # Compute modularity (if requested and graph is not empty)
         try:
-            if G.number_of_edges() > 0:
-                # Convert to undirected for community detection
-                G_undirected = G.to_undirected()
-                communities = list(nx.community.greedy_modularity_communities(G_undirected))
-                modularity = nx.community.modularity(G_undirected, communities)
+            if not compute_modularity:
+                modularity = None
+                communities = []
+            elif len(edge_rows_arr) > 0:
+                # NetworkX graph only for community detection. Detection and
+                # scoring are unweighted, so the graph carries no weight
+                # attributes: each undirected edge once, from the upper
+                # triangle of the symmetrized mask
+                und_rows, und_cols = np.nonzero(np.triu(edge_mask | edge_mask.T))
+                G_undirected = nx.Graph()
+                G_undirected.add_nodes_from(range(N))
+                G_undirected.add_edges_from(zip(und_rows.tolist(), und_cols.tolist()))
+                # Louvain is near-linear in the edges; greedy merging is
+                # O(n^2 log n). Exact optimal_modularity is out of reach at
+                # any real neuron count.
+                if N >= LOUVAIN_MIN_NODES:
+                    communities = nx.community.louvain_communities(G_undirected, weight=None, seed=0)
+                else:
+                    communities = list(nx.community.greedy_modularity_communities(G_undirected))
+                # Unweighted, like the detection itself: Gx weights are signed,
+                # which weighted modularity is not defined for
+                labels = np.empty(N, dtype=np.intp)
+                for label, community in enumerate(communities):
+                    labels[list(community)] = label
+                modularity = StateExtractor._modularity(labels, und_rows, und_cols)
             else:
                 modularity = 0.0
                 communities = []
@@ -125,15 +199,19 @@ class StateExtractor:
         
         return {
             'nodes': nodes,
-            'edges': edges,
+            'edges': {
+                'row': edge_rows,
+                'col': edge_cols,
+                'weight': edge_weights,
+            },
             'metrics': {
                 'num_neurons': len(nodes),
-                'num_edges': len(edges),
+                'num_edges': len(edge_rows),
                 'avg_degree': float(np.mean(degree_list)) if degree_list else 0.0,
                 'max_degree': int(np.max(degree_list)) if degree_list else 0,
                 'min_degree': int(np.min(degree_list)) if degree_list else 0,
                 'std_degree': float(np.std(degree_list)) if degree_list else 0.0,
-                'modularity': float(modularity),
+                'modularity': float(modularity) if modularity is not None else None,
                 'num_communities': len(communities),
                 'hub_threshold': float(hub_threshold),
                 'num_hubs': len(hubs),
@@ -142,63 +220,97 @@ class StateExtractor:
             }
         }
     
+    @staticmethod
+    def _modularity(labels: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> float:
+        """
+        Newman modularity of an unweighted undirected graph, in O(N + E).
+        
+        Q = sum_c [L_c / m - (d_c / 2m)^2] with L_c the edges inside community
+        c, d_c its degree sum and m the edge count; matches
+        nx.community.modularity(G, communities, weight=None).
+        
+        Args:
+            labels: Community label per node [N]
+            rows, cols: Each undirected edge once (self-loops allowed)
+        """
+        m = len(rows)
+        if m == 0:
+            return 0.0
+        num_communities = int(labels.max()) + 1
+        N = len(labels)
+        
+        # A self-loop adds 2 to its node's degree, as in NetworkX
+        degrees = np.bincount(rows, minlength=N) + np.bincount(cols, minlength=N)
+        degree_sums = np.bincount(labels, weights=degrees, minlength=num_communities)
+        
+        row_labels = labels[rows]
+        internal = np.bincount(
+            row_labels[row_labels == labels[cols]], minlength=num_communities
+        )
+        return float((internal / m).sum() - ((degree_sums / (2 * m)) ** 2).sum())
+    
     @staticmethod
     def extract_activation_sparsity(
-        y_activations: List[np.ndarray],
-        x_activations: Optional[List[np.ndarray]] = None
+        y_activations: Union[List[np.ndarray], np.ndarray],
+        x_activations: Optional[Union[List[np.ndarray], np.ndarray]] = None,
+        include_heatmap: bool = False
     ) -> Dict:
         """
         Compute activation sparsity metrics.
         
         Args:
-            y_activations: List of y activation matrices [L, T, N]
-            x_activations: Optional list of x activation matrices [L, T, N]
+            y_activations: y activation matrices [L, T, N] (stacked array or per-layer list)
+            x_activations: Optional x activation matrices [L, T, N] (stacked array or per-layer list)
+            include_heatmap: Also return the full y stack as 'y_heatmap',
+                encoded with encode_float16. Off by default; it is the
+                largest part of the payload
         
         Returns:
-            Sparsity metrics and heatmap data
+            Sparsity metrics (and heatmap data if requested)
         """
-        # Stack activations [L, T, N]
-        y_stack = np.stack(y_activations, axis=0)
+        # Stack activations [L, T, N], in float32: the reductions below are
+        # memory-bound and need no more precision for visualization
+        y_stack = StateExtractor._stack_layers(y_activations)
         L, T, N = y_stack.shape
         
+        # Non-zero counts along each axis and per-neuron sums, in one pass
+        layer_active, token_active, neuron_active, neuron_sum = activation_stats(y_stack)
+        
         # Compute sparsity per layer
-        y_sparsity_per_layer = []
-        for layer_idx in range(L):
-            non_zero = (y_stack[layer_idx] != 0).mean()
-            y_sparsity_per_layer.append(float(non_zero))
+        y_sparsity_per_layer = (layer_active / (T * N)).tolist()
         
         # Compute sparsity per token (averaged across layers)
-        y_sparsity_per_token = []
-        for token_idx in range(T):
-            non_zero = (y_stack[:, token_idx, :] != 0).mean()
-            y_sparsity_per_token.append(float(non_zero))
+        y_sparsity_per_token = (token_active / (L * N)).tolist()
         
         # Average activation per neuron (across layers and tokens)
-        y_avg_activation = y_stack.mean(axis=(0, 1))  # [N]
+        y_avg_activation = neuron_sum / (L * T)  # [N]
         
         # Activation frequency per neuron
-        y_activation_frequency = (y_stack != 0).mean(axis=(0, 1))  # [N]
+        y_activation_frequency = neuron_active / (L * T)  # [N]
         
         result = {
             'y_sparsity_per_layer': y_sparsity_per_layer,
             'y_sparsity_per_token': y_sparsity_per_token,
             'y_avg_sparsity': float(np.mean(y_sparsity_per_layer)),
             'y_std_sparsity': float(np.std(y_sparsity_per_layer)),
-            'y_heatmap': y_stack.tolist(),  # [L, T, N] for visualization
             'y_neuron_metrics': {
                 'avg_activation': y_avg_activation.tolist(),
                 'activation_frequency': y_activation_frequency.tolist(),
             }
         }
         
+        if include_heatmap:
+            # [L, T, N] for visualization; float16 is plenty for display
+            result['y_heatmap'] = StateExtractor.encode_float16(y_stack)
+        
         # If x_activations provided, compute x sparsity too
         if x_activations is not None:
-            x_stack = np.stack(x_activations, axis=0)
+            x_stack = StateExtractor._stack_layers(x_activations)
             
-            x_sparsity_per_layer = []
-            for layer_idx in range(L):
-                non_zero = (x_stack[layer_idx] != 0).mean()
-                x_sparsity_per_layer.append(float(non_zero))
+            # count_nonzero reduces without a boolean temporary of the stack
+            x_sparsity_per_layer = (
+                np.count_nonzero(x_stack, axis=(1, 2)) / x_stack[0].size
+            ).tolist()
             
             result['x_sparsity_per_layer'] = x_sparsity_per_layer
             result['x_avg_sparsity'] = float(np.mean(x_sparsity_per_layer))
@@ -208,55 +320,96 @@ class StateExtractor:
     
     @staticmethod
     def extract_attention_flow(
-        attention_weights: List[np.ndarray],
-        top_k: int = 30
+        attention_weights: Optional[Union[List[np.ndarray], np.ndarray]],
+        top_k: int = 30,
+        attention_topk: Optional[Dict] = None
     ) -> Dict:
         """
         Extract attention flow patterns.
         
         Args:
-            attention_weights: List of attention matrices [L, B, T, T]
+            attention_weights: Attention matrices [L, B, T, T], as a stacked
+                array or a list of per-layer [B, T, T] arrays. May be None or
+                empty when attention_topk covers top_k (tracking without
+                capture_attention keeps only the top-k summary)
             top_k: Number of top attention edges to keep per layer
+            attention_topk: Optional top-k summary captured on device by
+                BDHInstrumented (states['attention_topk']); used instead of
+                sorting the full matrices when it was taken with the same k
         
         Returns:
-            Attention flow data
+            Attention flow data; 'attention_per_layer' holds the batch-averaged
+            [L, T, T] matrices encoded with encode_float16, or None if only
+            the top-k summary was given
         """
-        # Stack and average over batch: [L, T, T]
-        attn_stack = np.stack([a.mean(axis=0) for a in attention_weights], axis=0)
-        L, T, _ = attn_stack.shape
-        
-        # Extract top-k attention edges per layer
-        attention_edges_per_layer = []
-        for layer_idx in range(L):
-            attn_matrix = attn_stack[layer_idx]  # [T, T]
+        has_matrices = attention_weights is not None and len(attention_weights) > 0
+        
+        if attention_topk is not None and attention_topk['k'] == min(top_k, attention_topk['T'] ** 2):
+            T = attention_topk['T']
+            attention_edges_per_layer = [
+                [
+                    {'source': idx // T, 'target': idx % T, 'weight': weight}
+                    for idx, weight in zip(indices.tolist(), values.tolist())
+                ]
+                for indices, values in zip(attention_topk['indices'], attention_topk['values'])
+            ]
             
-            # Get top-k edges
-            flat_indices = np.argsort(attn_matrix.flatten())[-top_k:]
-            edges = []
-            for flat_idx in flat_indices:
-                source = int(flat_idx // T)
-                target = int(flat_idx % T)
-                weight = float(attn_matrix[source, target])
-                edges.append({
-                    'source': source,
-                    'target': target,
-                    'weight': weight
-                })
+            attention_per_layer = None
+            if has_matrices:
+                attention_per_layer = StateExtractor.encode_float16(
+                    np.asarray(attention_weights, dtype=np.float32).mean(axis=1)
+                )
             
-            attention_edges_per_layer.append(edges)
+            return {
+                'attention_per_layer': attention_per_layer,
+                'attention_edges_per_layer': attention_edges_per_layer,
+                'avg_attention_per_layer': attention_topk['avg_per_layer'].tolist(),
+            }
+        
+        if not has_matrices:
+            raise ValueError("attention_weights are required without a matching attention_topk")
+        
+        # Stack (as float32) and average over batch in one reduction: [L, T, T]
+        attn_stack = np.asarray(attention_weights, dtype=np.float32).mean(axis=1)
+        L, T, _ = attn_stack.shape
+        
+        # Extract top-k attention edges of all layers at once: a linear-time
+        # partial select of the k largest per row of [L, T * T], then only
+        # those k sorted ascending
+        k = min(top_k, T * T)
+        flat = attn_stack.reshape(L, T * T)
+        if k > 0:
+            top = np.argpartition(flat, -k, axis=1)[:, -k:]
+        else:
+            top = np.zeros((L, 0), dtype=np.intp)
+        top = np.take_along_axis(
+            top, np.argsort(np.take_along_axis(flat, top, axis=1), axis=1, kind='stable'), axis=1
+        )
+        weights = np.take_along_axis(flat, top, axis=1)
+        sources, targets = np.divmod(top, T)
+        
+        attention_edges_per_layer = [
+            [
+                {'source': source, 'target': target, 'weight': weight}
+                for source, target, weight in zip(layer_sources, layer_targets, layer_weights)
+            ]
+            for layer_sources, layer_targets, layer_weights in zip(
+                sources.tolist(), targets.tolist(), weights.tolist()
+            )
+        ]
         
         # Average attention per layer
         avg_attention_per_layer = attn_stack.mean(axis=(1, 2)).tolist()
         
         return {
-            'attention_per_layer': [a.tolist() for a in attn_stack],
+            'attention_per_layer': StateExtractor.encode_float16(attn_stack),
             'attention_edges_per_layer': attention_edges_per_layer,
             'avg_attention_per_layer': avg_attention_per_layer,
         }
     
     @staticmethod
     def identify_concept_neurons(
-        y_activations: List[np.ndarray],
+        y_activations: Union[List[np.ndarray], np.ndarray],
         input_tokens: np.ndarray,
         vocab_size: int,
         threshold: float = 0.5
@@ -265,7 +418,7 @@ class StateExtractor:
         Identify neurons that consistently activate for specific tokens (concepts).
         
         Args:
-            y_activations: List of y activation matrices [L, T, N]
+            y_activations: y activation matrices [L, T, N] (stacked array or per-layer list)
             input_tokens: Input token IDs [T]
             vocab_size: Size of vocabulary
             threshold: Activation threshold
@@ -273,72 +426,66 @@ class StateExtractor:
         Returns:
             Concept-neuron mapping
         """
-        # Stack activations [L, T, N]
-        y_stack = np.stack(y_activations, axis=0)
+        # Stack activations [L, T, N] (float32)
+        y_stack = StateExtractor._stack_layers(y_activations)
         L, T, N = y_stack.shape
         
-        # For each token type, find neurons that activate
-        concept_neurons = defaultdict(list)
-        
-        for token_id in range(vocab_size):
-            # Find positions where this token appears
-            token_positions = np.where(input_tokens == token_id)[0]
-            
-            if len(token_positions) == 0:
-                continue
-            
-            # Get activations at these positions (averaged across layers)
-            token_activations = y_stack[:, token_positions, :].mean(axis=(0, 1))  # [N]
-            
-            # Find neurons with high activation
-            active_neurons = np.where(token_activations > threshold)[0]
-            
-            concept_neurons[int(token_id)] = [
-                {
-                    'neuron_id': int(neuron_id),
-                    'avg_activation': float(token_activations[neuron_id])
-                }
-                for neuron_id in active_neurons
+        # Mean activation of every token type over its positions (averaged
+        # across layers), summed into one [vocab_size, N] table by a single
+        # one-hot matmul (ids outside the vocabulary are ignored)
+        input_tokens = np.asarray(input_tokens)
+        in_vocab = (input_tokens >= 0) & (input_tokens < vocab_size)
+        tokens = input_tokens[in_vocab]
+        position_mean = y_stack.mean(axis=0)[in_vocab]  # [T', N]
+        one_hot = (np.arange(vocab_size)[:, None] == tokens).astype(np.float32)  # [vocab_size, T']
+        sums = one_hot @ position_mean
+        counts = np.bincount(tokens, minlength=vocab_size)
+        token_activations = sums / np.maximum(counts, 1)[:, None]
+        
+        # Neurons with high activation, for token types present in the input
+        concept_neurons = {}
+        for token_id in np.flatnonzero(counts).tolist():
+            active_neurons = np.flatnonzero(token_activations[token_id] > threshold)
+            concept_neurons[token_id] = [
+                {'neuron_id': neuron_id, 'avg_activation': avg_activation}
+                for neuron_id, avg_activation in zip(
+                    active_neurons.tolist(),
+                    token_activations[token_id, active_neurons].tolist()
+                )
             ]
         
-        return dict(concept_neurons)
+        return concept_neurons
     
     @staticmethod
     def compute_layer_statistics(
-        y_activations: List[np.ndarray],
-        x_activations: List[np.ndarray]
+        y_activations: Union[List[np.ndarray], np.ndarray],
+        x_activations: Union[List[np.ndarray], np.ndarray]
     ) -> Dict:
         """
         Compute per-layer statistics.
         
         Args:
-            y_activations: List of y activation matrices [L, T, N]
-            x_activations: List of x activation matrices [L, T, N]
+            y_activations: y activation matrices [L, T, N] (stacked array or per-layer list)
+            x_activations: x activation matrices [L, T, N] (stacked array or per-layer list)
         
         Returns:
             Layer statistics
         """
-        L = len(y_activations)
-        
-        stats = []
-        for layer_idx in range(L):
-            y = y_activations[layer_idx]
-            x = x_activations[layer_idx]
-            
-            layer_stats = {
-                'layer': layer_idx,
-                'y_mean': float(y.mean()),
-                'y_std': float(y.std()),
-                'y_max': float(y.max()),
-                'y_min': float(y.min()),
-                'y_sparsity': float((y != 0).mean()),
-                'x_mean': float(x.mean()),
-                'x_std': float(x.std()),
-                'x_max': float(x.max()),
-                'x_min': float(x.min()),
-                'x_sparsity': float((x != 0).mean()),
-            }
-            stats.append(layer_stats)
+        # Each statistic is one reduction over the stacked [L, T, N] arrays,
+        # giving all layers at once
+        y = StateExtractor._stack_layers(y_activations)
+        x = StateExtractor._stack_layers(x_activations)
+        
+        columns = {'layer': range(len(y))}
+        for prefix, stack in (('y', y), ('x', x)):
+            columns[f'{prefix}_mean'] = stack.mean(axis=(1, 2)).tolist()
+            columns[f'{prefix}_std'] = stack.std(axis=(1, 2)).tolist()
+            columns[f'{prefix}_max'] = stack.max(axis=(1, 2)).tolist()
+            columns[f'{prefix}_min'] = stack.min(axis=(1, 2)).tolist()
+            columns[f'{prefix}_sparsity'] = (np.count_nonzero(stack, axis=(1, 2)) / stack[0].size).tolist()
+        
+        # Same key order as before: layer, y_* stats, x_* stats
+        stats = [dict(zip(columns, row)) for row in zip(*columns.values())]
         
         return {'layer_statistics': stats}
 
@@ -357,7 +504,7 @@ if __name__ == '__main__':
     
     topology = StateExtractor.extract_graph_topology(Gx, threshold=0.1, top_k_nodes=20)
     print(f"   Nodes: {len(topology['nodes'])}")
-    print(f"   Edges: {len(topology['edges'])}")
+    print(f"   Edges: {len(topology['edges']['row'])}")
     print(f"   Avg degree: {topology['metrics']['avg_degree']:.2f}")
     print(f"   Num hubs: {topology['metrics']['num_hubs']}")
     
@@ -376,7 +523,7 @@ if __name__ == '__main__':
     attention_weights = [np.random.rand(1, T, T) for _ in range(L)]
     
     attention_flow = StateExtractor.extract_attention_flow(attention_weights, top_k=10)
-    print(f"   Attention layers: {len(attention_flow['attention_per_layer'])}")
+    print(f"   Attention layers: {attention_flow['attention_per_layer']['shape'][0]}")
     print(f"   Top edges per layer: {len(attention_flow['attention_edges_per_layer'][0])}")
     
     # Test concept neuron identification
@@ -19,6 +19,10 @@ const apiClient = axios.create({
 export interface InferenceRequest {
     input_tokens: number[];
     track_states: boolean;
+    predictions_encoding?: 'list' | 'int16_base64';
+    // 'sparse' returns states as COO arrays ({shape, indices, values}) instead of dense arrays
+    detail_level?: 'full' | 'sparse';
+    state_threshold?: number;
 }
 
 export interface SparsityMetrics {
@@ -34,6 +38,7 @@ export interface SparsityMetrics {
 
 export interface InferenceResponse {
     predictions: number[];
+    predictions_dtype?: string;
     states?: {
         y_activations: number[][][];  // [layers, tokens, neurons]
         x_activations: number[][][];
@@ -61,6 +66,13 @@ export interface TopologyEdge {
     weight: number;
 }
 
+// Edges as sent by the backend: COO form, edge k is row[k] -> col[k]
+export interface TopologyEdgesCOO {
+    row: number[];
+    col: number[];
+    weight: number[];
+}
+
 export interface TopologyMetrics {
     num_neurons: number;
     num_edges: number;
@@ -68,7 +80,7 @@ export interface TopologyMetrics {
     max_degree: number;
     min_degree: number;
     std_degree: number;
-    modularity: number;
+    modularity: number | null;  // null when requested without modularity
     num_communities: number;
     hub_threshold: number;
     num_hubs: number;
@@ -107,7 +119,19 @@ export const runInference = async (
     request: InferenceRequest
 ): Promise<InferenceResponse> => {
     const response = await apiClient.post<InferenceResponse>('/api/infer', request);
-    return response.data;
+    const data = response.data;
+
+    // int16_base64 predictions arrive as a string; decode back to a number[]
+    const predictions = data.predictions as number[] | string;
+    if (typeof predictions === 'string') {
+        const bytes = Uint8Array.from(atob(predictions), (c) => c.charCodeAt(0));
+        const view = new DataView(bytes.buffer);
+        data.predictions = Array.from(
+            { length: bytes.length / 2 },
+            (_, i) => view.getInt16(i * 2, true)
+        );
+    }
+    return data;
 };
 
 /**
@@ -115,13 +139,27 @@ export const runInference = async (
  */
 export const getTopology = async (
     threshold: number = 0.1,
-    topKNodes?: number
+    topKNodes?: number,
+    computeModularity: boolean = true
 ): Promise<TopologyResponse> => {
     const params: any = { threshold };
     if (topKNodes) params.top_k_nodes = topKNodes;
-
-    const response = await apiClient.get<TopologyResponse>('/api/topology', { params });
-    return response.data;
+    if (!computeModularity) params.compute_modularity = false;
+
+    const response = await apiClient.get<Omit<TopologyResponse, 'edges'> & { edges: TopologyEdgesCOO }>(
+        '/api/topology',
+        { params }
+    );
+
+    // Expand COO edges into edge objects
+    const { row, col, weight } = response.data.edges;
+    const edges: TopologyEdge[] = row.map((source, k) => ({
+        source,
+        target: col[k],
+        weight: weight[k],
+    }));
+
+    return { ...response.data, edges };
 };
 
 /**
@@ -5,11 +5,25 @@ This script tests all API endpoints to ensure they're working correctly.
 """
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+import orjson
 import time
 
 BASE_URL = "http://localhost:8000"
 
+# One keep-alive connection reused by every test instead of a new TCP
+# connection per request
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+def parse_json(response):
+    """Decode a response body with orjson (the server encodes with it too)"""
+    return orjson.loads(response.content)
+
+def pretty_json(data):
+    """Indented JSON text for printing"""
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+
 def print_section(title):
     """Print a section header"""
     print("\n" + "="*60)
@@ -20,9 +34,9 @@ def test_root():
     """Test root endpoint"""
     print_section("TEST 1: Root Endpoint")
     
-    response = requests.get(f"{BASE_URL}/")
+    response = SESSION.get(f"{BASE_URL}/")
     print(f"Status: {response.status_code}")
-    print(f"Response: {json.dumps(response.json(), indent=2)}")
+    print(f"Response: {pretty_json(parse_json(response))}")
     
     assert response.status_code == 200
     print("✓ Root endpoint working")
@@ -31,10 +45,10 @@ def test_health():
     """Test health check endpoint"""
     print_section("TEST 2: Health Check")
     
-    response = requests.get(f"{BASE_URL}/health")
+    response = SESSION.get(f"{BASE_URL}/health")
     print(f"Status: {response.status_code}")
-    data = response.json()
-    print(f"Response: {json.dumps(data, indent=2)}")
+    data = parse_json(response)
+    print(f"Response: {pretty_json(data)}")
     
     assert response.status_code == 200
     assert data['status'] == 'healthy'
@@ -45,9 +59,9 @@ def test_config():
     """Test config endpoint"""
     print_section("TEST 3: Model Configuration")
     
-    response = requests.get(f"{BASE_URL}/api/config")
+    response = SESSION.get(f"{BASE_URL}/api/config")
     print(f"Status: {response.status_code}")
-    data = response.json()
+    data = parse_json(response)
     print(f"Configuration:")
     for key, value in data.items():
         print(f"  {key}: {value}")
@@ -65,13 +79,13 @@ def test_inference():
         "track_states": False  # Don't track states for speed
     }
     
-    print(f"Request: {json.dumps(payload, indent=2)}")
+    print(f"Request: {pretty_json(payload)}")
     
-    response = requests.post(f"{BASE_URL}/api/infer", json=payload)
+    response = SESSION.post(f"{BASE_URL}/api/infer", json=payload)
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
-        data = response.json()
+        data = parse_json(response)
         print(f"Predictions length: {len(data['predictions'])}")
         print(f"Predictions: {data['predictions'][:10]}...")
         print("✓ Inference working")
@@ -88,14 +102,14 @@ def test_inference_with_states():
         "track_states": True
     }
     
-    print(f"Request: {json.dumps(payload, indent=2)}")
+    print(f"Request: {pretty_json(payload)}")
     print("Running inference (this may take a moment)...")
     
-    response = requests.post(f"{BASE_URL}/api/infer", json=payload)
+    response = SESSION.post(f"{BASE_URL}/api/infer", json=payload)
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
-        data = response.json()
+        data = parse_json(response)
         print(f"Predictions: {data['predictions']}")
         print(f"Sparsity:")
         print(f"  Y mean: {data['sparsity']['y_sparsity_mean']:.4f}")
@@ -117,15 +131,15 @@ def test_topology():
         "top_k_nodes": 50
     }
     
-    print(f"Parameters: {json.dumps(params, indent=2)}")
+    print(f"Parameters: {pretty_json(params)}")
     
-    response = requests.get(f"{BASE_URL}/api/topology", params=params)
+    response = SESSION.get(f"{BASE_URL}/api/topology", params=params)
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
-        data = response.json()
+        data = parse_json(response)
         print(f"Nodes: {len(data['nodes'])}")
-        print(f"Edges: {len(data['edges'])}")
+        print(f"Edges: {len(data['edges']['row'])}")
         print(f"Metrics:")
         for key, value in data['metrics'].items():
             if isinstance(value, float):
@@ -148,13 +162,13 @@ def test_sparsity():
         "track_states": True
     }
     
-    print(f"Request: {json.dumps(payload, indent=2)}")
+    print(f"Request: {pretty_json(payload)}")
     
-    response = requests.post(f"{BASE_URL}/api/sparsity", json=payload)
+    response = SESSION.post(f"{BASE_URL}/api/sparsity", json=payload)
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
-        data = response.json()
+        data = parse_json(response)
         print(f"Y Sparsity:")
         print(f"  Mean: {data['y_sparsity_mean']:.4f}")
         print(f"  Std: {data['y_sparsity_std']:.4f}")
@@ -189,11 +203,11 @@ def test_pathfinding():
     
     print("\nRunning pathfinding (this may take a moment)...")
     
-    response = requests.post(f"{BASE_URL}/api/pathfind", json=payload)
+    response = SESSION.post(f"{BASE_URL}/api/pathfind", json=payload)
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
-        data = response.json()
+        data = parse_json(response)
         print(f"\nPredicted board:")
         for row in data['predicted_board']:
             print(f"  {row}")
@@ -5,11 +5,18 @@ Tests the /api/pathfind-model endpoint with various scenarios.
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import orjson
 import numpy as np
 
 API_URL = "http://localhost:8000"
 
+# One keep-alive connection reused by every test instead of a new TCP
+# connection per request
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
 def create_simple_maze():
     """Create a simple 10x10 maze"""
     board = np.zeros((10, 10), dtype=int)
@@ -25,37 +32,38 @@ def create_simple_maze():
     
     return board.tolist()
 
-def test_bfs_mode():
+# The maze never changes and is only read, so every test shares one copy
+SIMPLE_MAZE = create_simple_maze()
+
+def test_bfs_mode(board=SIMPLE_MAZE):
     """Test BFS-only mode (baseline)"""
     print("\n" + "="*70)
     print("TEST 1: BFS Mode (Baseline)")
     print("="*70)
     
-    board = create_simple_maze()
-    
-    response = requests.post(
+    response = SESSION.post(
         f"{API_URL}/api/pathfind",
         json={"board": board}
     )
     
     if response.status_code == 200:
-        data = response.json()
+        data = orjson.loads(response.content)
         print(f"✅ BFS Solution found: {len(data['solution'])} steps")
         print(f"   Path: {data['solution'][:3]}... → {data['solution'][-3:]}")
     else:
         print(f"❌ Error: {response.status_code}")
         print(response.text)
 
-def test_model_mode_without_checkpoint():
+def test_model_mode_without_checkpoint(board=SIMPLE_MAZE):
     """Test model mode when checkpoint doesn't exist"""
     print("\n" + "="*70)
     print("TEST 2: Model Mode (No Checkpoint)")
     print("="*70)
     
-    board = create_simple_maze()
-    
-    response = requests.post(
+    # Only counts are printed, so skip the solutions and visualization data
+    response = SESSION.post(
         f"{API_URL}/api/pathfind-model",
+        params={"meta": 1},
         json={"board": board}
     )
     
@@ -63,22 +71,22 @@ def test_model_mode_without_checkpoint():
         data = response.json()
         print(f"Model Available: {data['model_available']}")
         print(f"Model Error: {data['model_error']}")
-        print(f"BFS Solution: {len(data['bfs_solution'])} steps")
-        print(f"Fallback Working: {'✅' if data['bfs_solution'] else '❌'}")
+        print(f"BFS Solution: {data['bfs_steps']} steps")
+        print(f"Fallback Working: {'✅' if data['bfs_steps'] else '❌'}")
     else:
         print(f"❌ Error: {response.status_code}")
         print(response.text)
 
-def test_model_mode_with_checkpoint():
+def test_model_mode_with_checkpoint(board=SIMPLE_MAZE):
     """Test model mode when checkpoint exists"""
     print("\n" + "="*70)
     print("TEST 3: Model Mode (With Checkpoint)")
     print("="*70)
     
-    board = create_simple_maze()
-    
-    response = requests.post(
+    # Only counts are printed, so skip the solutions and visualization data
+    response = SESSION.post(
         f"{API_URL}/api/pathfind-model",
+        params={"meta": 1},
         json={"board": board}
     )
     
@@ -108,7 +116,7 @@ def test_model_status():
     print("TEST 4: Model Status")
     print("="*70)
     
-    response = requests.get(f"{API_URL}/api/model-status")
+    response = SESSION.get(f"{API_URL}/api/model-status")
     
     if response.status_code == 200:
         data = response.json()
@@ -125,6 +133,8 @@ def run_all_tests():
     print("🧪 TESTING MODEL-BASED PATHFINDING INTEGRATION")
     print("="*70)
     
+    # Tests 1-3 send the same maze; the server answers repeats of an
+    # identical board from its pathfinding cache
     try:
         # Test 1: BFS baseline
         test_bfs_mode()